@@ -0,0 +1,140 @@
+package org.neo4py;
+
+import java.util.Iterator;
+import java.util.NoSuchElementException;
+
+import org.neo4j.graphdb.Direction;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * Drains java iterators in chunks, so python reads many items per call.
+ */
+public class Buffers {
+	
+	/**
+	 * Relationships of node of any of types (all types if empty) in direction,
+	 * as a single iterator.
+	 */
+	public static Iterator<Relationship> relationships(final Node node, final Direction direction,
+			final RelationshipType[] types) {
+		if (types.length == 0) {
+			return node.getRelationships(direction).iterator();
+		}
+		if (direction == Direction.BOTH || types.length == 1) {
+			return types.length == 1 ?
+				node.getRelationships(types[0], direction).iterator() :
+				node.getRelationships(types).iterator();
+		}
+		return new Iterator<Relationship>() {
+			private int next = 0;
+			private Iterator<Relationship> current = node.getRelationships(types[next++], direction).iterator();
+			
+			public boolean hasNext() {
+				while (!current.hasNext() && next < types.length) {
+					current = node.getRelationships(types[next++], direction).iterator();
+				}
+				return current.hasNext();
+			}
+			
+			public Relationship next() {
+				if (!hasNext()) {
+					throw new NoSuchElementException();
+				}
+				return current.next();
+			}
+			
+			public void remove() {
+				throw new UnsupportedOperationException();
+			}
+		};
+	}
+	
+	public static boolean hasRelationship(Node node, Direction direction, RelationshipType[] types) {
+		if (types.length == 0) {
+			return node.hasRelationship(direction);
+		}
+		if (direction == Direction.BOTH) {
+			return node.hasRelationship(types);
+		}
+		for (RelationshipType type : types) {
+			if (node.hasRelationship(type, direction)) {
+				return true;
+			}
+		}
+		return false;
+	}
+	
+	/**
+	 * The next (up to) max nodes of nodes.  An empty array means the iterator
+	 * is exhausted.
+	 */
+	public static Node[] nextNodes(Iterator<Node> nodes, int max) {
+		Node[] buffer = new Node[max];
+		int count = 0;
+		while (count < max && nodes.hasNext()) {
+			buffer[count++] = nodes.next();
+		}
+		if (count == max) {
+			return buffer;
+		}
+		Node[] result = new Node[count];
+		System.arraycopy(buffer, 0, result, 0, count);
+		return result;
+	}
+	
+	/**
+	 * Advances items by (up to) n items, returning how many were skipped.
+	 */
+	public static int skip(Iterator<?> items, int n) {
+		int count = 0;
+		while (count < n && items.hasNext()) {
+			items.next();
+			count++;
+		}
+		return count;
+	}
+	
+	/**
+	 * The next (up to) max relationships of rels.  An empty array means the
+	 * iterator is exhausted.
+	 */
+	public static Relationship[] nextRelationships(Iterator<Relationship> rels, int max) {
+		Relationship[] buffer = new Relationship[max];
+		int count = 0;
+		while (count < max && rels.hasNext()) {
+			buffer[count++] = rels.next();
+		}
+		if (count == max) {
+			return buffer;
+		}
+		Relationship[] result = new Relationship[count];
+		System.arraycopy(buffer, 0, result, 0, count);
+		return result;
+	}
+	
+	/**
+	 * Ids of the next (up to) max nodes or relationships of items.  An empty
+	 * array means the iterator is exhausted.
+	 */
+	public static long[] nextIds(Iterator<?> items, int max) {
+		long[] ids = new long[max];
+		int count = 0;
+		while (count < max && items.hasNext()) {
+			Object item = items.next();
+			if (item instanceof Node) {
+				ids[count++] = ((Node) item).getId();
+			} else {
+				ids[count++] = ((Relationship) item).getId();
+			}
+		}
+		if (count == max) {
+			return ids;
+		}
+		long[] result = new long[count];
+		System.arraycopy(ids, 0, result, 0, count);
+		return result;
+	}
+}
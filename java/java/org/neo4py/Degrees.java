@@ -0,0 +1,42 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Direction;
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * Counts relationships of nodes without handing them to python.  An empty
+ * types array counts relationships of all types.
+ */
+public class Degrees {
+	
+	public static int[] degrees(GraphDatabaseService db, long[] ids, RelationshipType[] types, Direction direction) {
+		int[] degrees = new int[ids.length];
+		for (int i = 0; i < ids.length; i++) {
+			degrees[i] = degree(db.getNodeById(ids[i]), types, direction);
+		}
+		return degrees;
+	}
+	
+	public static int degree(Node node, RelationshipType[] types, Direction direction) {
+		if (types.length == 0) {
+			return count(node.getRelationships(direction));
+		}
+		int degree = 0;
+		for (RelationshipType type : types) {
+			degree += count(node.getRelationships(type, direction));
+		}
+		return degree;
+	}
+	
+	private static int count(Iterable<Relationship> rels) {
+		int count = 0;
+		for (@SuppressWarnings("unused") Relationship rel : rels) {
+			count++;
+		}
+		return count;
+	}
+}
@@ -0,0 +1,136 @@
+package org.neo4py;
+
+import java.util.Collections;
+import java.util.Iterator;
+
+import org.neo4j.graphdb.Direction;
+import org.neo4j.graphdb.DynamicRelationshipType;
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * Streams the (start id, end id, weight) of every relationship of the given
+ * types (all types if none are given) in batches, visiting each relationship
+ * once from its start node.  Relationships without the weight property, or
+ * all of them if no weight property is given, have a weight of 1.
+ */
+public class EdgeCursor {
+	private final RelationshipType[] types;
+	private final String weightProperty;
+	private final Iterator<Node> nodes;
+	private Node node;
+	private int typeIndex;
+	private Iterator<Relationship> rels = Collections.<Relationship>emptyList().iterator();
+	
+	private long[] starts = new long[0];
+	private long[] ends = new long[0];
+	private double[] weights = new double[0];
+	
+	public EdgeCursor(GraphDatabaseService db, String[] types, String weightProperty) {
+		this.types = new RelationshipType[types.length];
+		for (int i = 0; i < types.length; i++) {
+			this.types[i] = DynamicRelationshipType.withName(types[i]);
+		}
+		this.weightProperty = weightProperty;
+		this.nodes = db.getAllNodes().iterator();
+	}
+	
+	/**
+	 * Reads the next (up to) max relationships, returning how many were read.
+	 * 0 means the cursor is exhausted.
+	 */
+	public int next(int max) {
+		long[] starts = new long[max];
+		long[] ends = new long[max];
+		double[] weights = new double[max];
+		int count = 0;
+		while (count < max && advance()) {
+			Relationship rel = rels.next();
+			starts[count] = node.getId();
+			ends[count] = rel.getEndNode().getId();
+			weights[count] = weight(rel);
+			count++;
+		}
+		this.starts = trim(starts, count);
+		this.ends = trim(ends, count);
+		this.weights = trim(weights, count);
+		return count;
+	}
+	
+	public long[] getStarts() {
+		return starts;
+	}
+	
+	public long[] getEnds() {
+		return ends;
+	}
+	
+	public double[] getWeights() {
+		return weights;
+	}
+	
+	/**
+	 * Ids of all nodes in the graph, in the order they are visited.
+	 */
+	public static long[] nodeIds(GraphDatabaseService db) {
+		long[] ids = new long[1024];
+		int count = 0;
+		for (Node node : db.getAllNodes()) {
+			if (count == ids.length) {
+				ids = trim(ids, count * 2);
+			}
+			ids[count++] = node.getId();
+		}
+		return trim(ids, count);
+	}
+	
+	
+	private boolean advance() {
+		while (!rels.hasNext()) {
+			if (node != null && typeIndex < types.length) {
+				rels = node.getRelationships(types[typeIndex++], Direction.OUTGOING).iterator();
+			} else if (nodes.hasNext()) {
+				node = nodes.next();
+				if (types.length == 0) {
+					rels = node.getRelationships(Direction.OUTGOING).iterator();
+					typeIndex = 0;
+				} else {
+					rels = node.getRelationships(types[0], Direction.OUTGOING).iterator();
+					typeIndex = 1;
+				}
+			} else {
+				return false;
+			}
+		}
+		return true;
+	}
+	
+	private double weight(Relationship rel) {
+		if (weightProperty == null) {
+			return 1.0;
+		}
+		Object value = rel.getProperty(weightProperty, null);
+		return value instanceof Number ? ((Number) value).doubleValue() : 1.0;
+	}
+	
+	private static long[] trim(long[] values, int length) {
+		if (values.length == length) {
+			return values;
+		}
+		long[] result = new long[length];
+		System.arraycopy(values, 0, result, 0, Math.min(length, values.length));
+		return result;
+	}
+	
+	private static double[] trim(double[] values, int length) {
+		if (values.length == length) {
+			return values;
+		}
+		double[] result = new double[length];
+		System.arraycopy(values, 0, result, 0, length);
+		return result;
+	}
+}
@@ -0,0 +1,67 @@
+package org.neo4py;
+
+import java.util.HashMap;
+import java.util.Map;
+
+import org.neo4j.graphdb.DynamicRelationshipType;
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.PropertyContainer;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * Creates many nodes or relationships, or sets many properties, in one call.
+ * Properties are passed flattened: propertyCounts[i] keys/values belong to the
+ * i-th entity.  Must be called within a transaction.
+ */
+public class EntityCreator {
+	
+	public static long[] createNodes(GraphDatabaseService db, int[] propertyCounts,
+			String[] keys, Object[] values) {
+		long[] ids = new long[propertyCounts.length];
+		int p = 0;
+		for (int i = 0; i < propertyCounts.length; i++) {
+			Node node = db.createNode();
+			p = setProperties(node, propertyCounts[i], keys, values, p);
+			ids[i] = node.getId();
+		}
+		return ids;
+	}
+	
+	public static long[] createRelationships(GraphDatabaseService db, long[] startIds,
+			String[] types, long[] endIds, int[] propertyCounts, String[] keys, Object[] values) {
+		Map<String, RelationshipType> typeCache = new HashMap<String, RelationshipType>();
+		long[] ids = new long[startIds.length];
+		int p = 0;
+		for (int i = 0; i < startIds.length; i++) {
+			RelationshipType type = typeCache.get(types[i]);
+			if (type == null) {
+				type = DynamicRelationshipType.withName(types[i]);
+				typeCache.put(types[i], type);
+			}
+			Node start = db.getNodeById(startIds[i]);
+			Node end = db.getNodeById(endIds[i]);
+			Relationship rel = start.createRelationshipTo(end, type);
+			p = setProperties(rel, propertyCounts[i], keys, values, p);
+			ids[i] = rel.getId();
+		}
+		return ids;
+	}
+	
+	/**
+	 * Sets keys[i] to values[i] on entity, for all i.
+	 */
+	public static void setProperties(PropertyContainer entity, String[] keys, Object[] values) {
+		setProperties(entity, keys.length, keys, values, 0);
+	}
+	
+	private static int setProperties(PropertyContainer entity, int count, String[] keys,
+			Object[] values, int offset) {
+		for (int end = offset + count; offset < end; offset++) {
+			entity.setProperty(keys[offset], values[offset]);
+		}
+		return offset;
+	}
+}
@@ -0,0 +1,86 @@
+package org.neo4py;
+
+import java.util.ArrayList;
+import java.util.Iterator;
+import java.util.List;
+import java.util.NoSuchElementException;
+
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.NotFoundException;
+import org.neo4j.graphdb.PropertyContainer;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.index.IndexHits;
+
+
+/**
+ * IndexHits over entities looked up by id, for hits served from a cache.
+ * Ids of entities deleted since are skipped.  Scores are all 1.
+ */
+public class IdHits<T extends PropertyContainer> implements IndexHits<T> {
+	private final List<T> items;
+	private final Iterator<T> iterator;
+	
+	private IdHits(List<T> items) {
+		this.items = items;
+		this.iterator = items.iterator();
+	}
+	
+	public static IdHits<Node> nodes(GraphDatabaseService db, long[] ids) {
+		List<Node> nodes = new ArrayList<Node>(ids.length);
+		for (long id : ids) {
+			try {
+				nodes.add(db.getNodeById(id));
+			} catch (NotFoundException ex) {
+				// deleted
+			}
+		}
+		return new IdHits<Node>(nodes);
+	}
+	
+	public static IdHits<Relationship> relationships(GraphDatabaseService db, long[] ids) {
+		List<Relationship> rels = new ArrayList<Relationship>(ids.length);
+		for (long id : ids) {
+			try {
+				rels.add(db.getRelationshipById(id));
+			} catch (NotFoundException ex) {
+				// deleted
+			}
+		}
+		return new IdHits<Relationship>(rels);
+	}
+	
+	public int size() {
+		return items.size();
+	}
+	
+	public void close() {
+	}
+	
+	public T getSingle() {
+		if (items.size() > 1) {
+			throw new NoSuchElementException("More than one item: " + items);
+		}
+		return items.isEmpty() ? null : items.get(0);
+	}
+	
+	public float currentScore() {
+		return 1;
+	}
+	
+	public boolean hasNext() {
+		return iterator.hasNext();
+	}
+	
+	public T next() {
+		return iterator.next();
+	}
+	
+	public void remove() {
+		throw new UnsupportedOperationException();
+	}
+	
+	public Iterator<T> iterator() {
+		return this;
+	}
+}
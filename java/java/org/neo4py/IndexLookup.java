@@ -0,0 +1,55 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.PropertyContainer;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.index.Index;
+import org.neo4j.graphdb.index.IndexHits;
+
+
+/**
+ * Exact index lookups of many values of a key in one call.  The ids of the
+ * hits for values[i] are ids[offsets[i] ... offsets[i + 1]].
+ */
+public class IndexLookup {
+	private final long[] ids;
+	private final int[] offsets;
+	
+	private IndexLookup(long[] ids, int[] offsets) {
+		this.ids = ids;
+		this.offsets = offsets;
+	}
+	
+	public long[] getIds() {
+		return ids;
+	}
+	
+	public int[] getOffsets() {
+		return offsets;
+	}
+	
+	public static IndexLookup get(Index<? extends PropertyContainer> index, String key, Object[] values) {
+		long[] ids = new long[values.length];
+		int[] offsets = new int[values.length + 1];
+		int count = 0;
+		for (int i = 0; i < values.length; i++) {
+			IndexHits<? extends PropertyContainer> hits = index.get(key, values[i]);
+			try {
+				for (PropertyContainer item : hits) {
+					if (count == ids.length) {
+						long[] grown = new long[count * 2];
+						System.arraycopy(ids, 0, grown, 0, count);
+						ids = grown;
+					}
+					ids[count++] = item instanceof Node ? ((Node) item).getId() : ((Relationship) item).getId();
+				}
+			} finally {
+				hits.close();
+			}
+			offsets[i + 1] = count;
+		}
+		long[] trimmed = new long[count];
+		System.arraycopy(ids, 0, trimmed, 0, count);
+		return new IndexLookup(trimmed, offsets);
+	}
+}
@@ -0,0 +1,64 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.index.Index;
+
+
+/**
+ * Adds or removes many index entries in one call.  Entry i is
+ * (ids[i], keys[i], values[i]), entities being looked up by id.  All ids are
+ * looked up before the index is changed, so a missing id (NotFoundException)
+ * leaves the index untouched.  Must be called within a transaction.
+ */
+public class Indexing {
+	
+	public static void addNodes(GraphDatabaseService db, Index<Node> index, long[] ids,
+			String[] keys, Object[] values) {
+		Node[] entities = nodes(db, ids);
+		for (int i = 0; i < ids.length; i++) {
+			index.add(entities[i], keys[i], values[i]);
+		}
+	}
+	
+	public static void addRelationships(GraphDatabaseService db, Index<Relationship> index, long[] ids,
+			String[] keys, Object[] values) {
+		Relationship[] entities = relationships(db, ids);
+		for (int i = 0; i < ids.length; i++) {
+			index.add(entities[i], keys[i], values[i]);
+		}
+	}
+	
+	public static void removeNodes(GraphDatabaseService db, Index<Node> index, long[] ids,
+			String[] keys, Object[] values) {
+		Node[] entities = nodes(db, ids);
+		for (int i = 0; i < ids.length; i++) {
+			index.remove(entities[i], keys[i], values[i]);
+		}
+	}
+	
+	public static void removeRelationships(GraphDatabaseService db, Index<Relationship> index, long[] ids,
+			String[] keys, Object[] values) {
+		Relationship[] entities = relationships(db, ids);
+		for (int i = 0; i < ids.length; i++) {
+			index.remove(entities[i], keys[i], values[i]);
+		}
+	}
+	
+	private static Node[] nodes(GraphDatabaseService db, long[] ids) {
+		Node[] nodes = new Node[ids.length];
+		for (int i = 0; i < ids.length; i++) {
+			nodes[i] = db.getNodeById(ids[i]);
+		}
+		return nodes;
+	}
+	
+	private static Relationship[] relationships(GraphDatabaseService db, long[] ids) {
+		Relationship[] rels = new Relationship[ids.length];
+		for (int i = 0; i < ids.length; i++) {
+			rels[i] = db.getRelationshipById(ids[i]);
+		}
+		return rels;
+	}
+}
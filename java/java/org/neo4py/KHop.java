@@ -0,0 +1,153 @@
+package org.neo4py;
+
+import java.util.ArrayList;
+import java.util.HashSet;
+import java.util.Iterator;
+import java.util.List;
+import java.util.Set;
+import java.util.concurrent.Callable;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.ThreadFactory;
+
+import org.neo4j.graphdb.Direction;
+import org.neo4j.graphdb.DynamicRelationshipType;
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * The distinct nodes within depth hops of each of many seed nodes, expanded
+ * breadth first, optionally in parallel.  The ids for seed i are
+ * ids[offsets[i] ... offsets[i + 1]], nearest first, not including the seed.
+ */
+public class KHop {
+	private final long[] ids;
+	private final int[] offsets;
+	
+	private KHop(long[] ids, int[] offsets) {
+		this.ids = ids;
+		this.offsets = offsets;
+	}
+	
+	public long[] getIds() {
+		return ids;
+	}
+	
+	public int[] getOffsets() {
+		return offsets;
+	}
+	
+	/**
+	 * Expands seeds on the calling thread if threads is 1, which sees the
+	 * caller's uncommitted changes.  Otherwise on a pool shared by all calls,
+	 * whose threads only see committed data.
+	 * 
+	 * @param maxNodes maximum number of ids per seed, negative for no limit
+	 * @param threads 1 to expand on the calling thread, else use the shared pool
+	 */
+	public static KHop expand(final GraphDatabaseService db, long[] seeds, final int depth, String[] types,
+			final Direction direction, final int maxNodes, int threads) throws InterruptedException {
+		final RelationshipType[] relTypes = new RelationshipType[types.length];
+		for (int i = 0; i < types.length; i++) {
+			relTypes[i] = DynamicRelationshipType.withName(types[i]);
+		}
+		
+		long[][] perSeed = new long[seeds.length][];
+		if (threads == 1 || seeds.length < 2) {
+			for (int i = 0; i < seeds.length; i++) {
+				perSeed[i] = expand(db.getNodeById(seeds[i]), depth, relTypes, direction, maxNodes);
+			}
+		} else {
+			List<Future<long[]>> results = new ArrayList<Future<long[]>>(seeds.length);
+			for (final long seed : seeds) {
+				results.add(pool().submit(new Callable<long[]>() {
+					public long[] call() {
+						return expand(db.getNodeById(seed), depth, relTypes, direction, maxNodes);
+					}
+				}));
+			}
+			try {
+				for (int i = 0; i < seeds.length; i++) {
+					perSeed[i] = results.get(i).get();
+				}
+			} catch (ExecutionException e) {
+				Throwable cause = e.getCause();
+				if (cause instanceof RuntimeException) {
+					throw (RuntimeException) cause;
+				}
+				throw new RuntimeException(cause);
+			} finally {
+				for (Future<long[]> result : results) {
+					result.cancel(true);
+				}
+			}
+		}
+		
+		int[] offsets = new int[seeds.length + 1];
+		for (int i = 0; i < seeds.length; i++) {
+			offsets[i + 1] = offsets[i] + perSeed[i].length;
+		}
+		long[] ids = new long[offsets[seeds.length]];
+		for (int i = 0; i < seeds.length; i++) {
+			System.arraycopy(perSeed[i], 0, ids, offsets[i], perSeed[i].length);
+		}
+		return new KHop(ids, offsets);
+	}
+	
+	private static ExecutorService pool;
+	
+	private static synchronized ExecutorService pool() {
+		if (pool == null) {
+			pool = Executors.newFixedThreadPool(Runtime.getRuntime().availableProcessors(), new ThreadFactory() {
+				public Thread newThread(Runnable r) {
+					Thread thread = new Thread(r, "neo4py-khop");
+					thread.setDaemon(true);
+					return thread;
+				}
+			});
+		}
+		return pool;
+	}
+	
+	private static long[] expand(Node seed, int depth, RelationshipType[] types, Direction direction,
+			int maxNodes) {
+		int limit = maxNodes < 0 ? Integer.MAX_VALUE : maxNodes;
+		Set<Long> seen = new HashSet<Long>();
+		seen.add(seed.getId());
+		List<Node> frontier = new ArrayList<Node>();
+		frontier.add(seed);
+		long[] found = new long[16];
+		int count = 0;
+		
+		for (int hop = 0; hop < depth && !frontier.isEmpty() && count < limit; hop++) {
+			List<Node> next = new ArrayList<Node>();
+			for (Node node : frontier) {
+				Iterator<Relationship> rels = Buffers.relationships(node, direction, types);
+				while (rels.hasNext() && count < limit) {
+					Node other = rels.next().getOtherNode(node);
+					if (seen.add(other.getId())) {
+						if (count == found.length) {
+							long[] grown = new long[count * 2];
+							System.arraycopy(found, 0, grown, 0, count);
+							found = grown;
+						}
+						found[count++] = other.getId();
+						next.add(other);
+					}
+				}
+				if (count >= limit) {
+					break;
+				}
+			}
+			frontier = next;
+		}
+		long[] result = new long[count];
+		System.arraycopy(found, 0, result, 0, count);
+		return result;
+	}
+}
@@ -0,0 +1,74 @@
+package org.neo4py;
+
+import java.util.Iterator;
+
+import org.neo4j.graphdb.Direction;
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.RelationshipType;
+
+
+/**
+ * Streams the neighbours of a node (the other nodes of its relationships of
+ * types in direction) in batches, with the values of the requested
+ * properties.  Values of neighbour i are at values[i * keys.length ...],
+ * null where a neighbour doesn't have the property.
+ */
+public class NeighborCursor {
+	private final Node node;
+	private final Iterator<Relationship> rels;
+	private final String[] keys;
+	private int remaining;
+	
+	private long[] ids = new long[0];
+	private Object[] values = new Object[0];
+	
+	/**
+	 * @param limit maximum number of neighbours returned, negative for no limit
+	 */
+	public NeighborCursor(Node node, Direction direction, RelationshipType[] types, String[] keys, int limit) {
+		this.node = node;
+		this.rels = Buffers.relationships(node, direction, types);
+		this.keys = keys;
+		this.remaining = limit < 0 ? Integer.MAX_VALUE : limit;
+	}
+	
+	/**
+	 * Reads the next (up to) max neighbours, returning how many were read.
+	 * 0 means the cursor is exhausted.
+	 */
+	public int next(int max) {
+		max = Math.min(max, remaining);
+		long[] ids = new long[max];
+		Object[] values = new Object[max * keys.length];
+		int count = 0;
+		while (count < max && rels.hasNext()) {
+			Node other = rels.next().getOtherNode(node);
+			ids[count] = other.getId();
+			for (int k = 0; k < keys.length; k++) {
+				values[count * keys.length + k] = other.getProperty(keys[k], null);
+			}
+			count++;
+		}
+		remaining -= count;
+		if (count < max) {
+			long[] trimmedIds = new long[count];
+			System.arraycopy(ids, 0, trimmedIds, 0, count);
+			Object[] trimmedValues = new Object[count * keys.length];
+			System.arraycopy(values, 0, trimmedValues, 0, trimmedValues.length);
+			ids = trimmedIds;
+			values = trimmedValues;
+		}
+		this.ids = ids;
+		this.values = values;
+		return count;
+	}
+	
+	public long[] getIds() {
+		return ids;
+	}
+	
+	public Object[] getValues() {
+		return values;
+	}
+}
@@ -0,0 +1,87 @@
+package org.neo4py;
+
+import java.util.Collections;
+import java.util.Iterator;
+
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Path;
+import org.neo4j.graphdb.Relationship;
+
+
+/**
+ * Node and relationship ids of the next (up to) max paths of an iterator,
+ * flattened into arrays so they can be copied to python in a few calls.
+ * Path i has lengths[i] relationships and lengths[i] + 1 nodes.
+ */
+public class PathBatch {
+	private final long[] nodeIds;
+	private final long[] relationshipIds;
+	private final int[] lengths;
+	
+	private PathBatch(long[] nodeIds, long[] relationshipIds, int[] lengths) {
+		this.nodeIds = nodeIds;
+		this.relationshipIds = relationshipIds;
+		this.lengths = lengths;
+	}
+	
+	public long[] getNodeIds() {
+		return nodeIds;
+	}
+	
+	public long[] getRelationshipIds() {
+		return relationshipIds;
+	}
+	
+	public int[] getLengths() {
+		return lengths;
+	}
+	
+	public int size() {
+		return lengths.length;
+	}
+	
+	public static PathBatch of(Path path) {
+		return next(Collections.singletonList(path).iterator(), 1);
+	}
+	
+	public static PathBatch next(Iterator<? extends Path> paths, int max) {
+		LongList nodeIds = new LongList();
+		LongList relationshipIds = new LongList();
+		int[] lengths = new int[max];
+		int count = 0;
+		while (count < max && paths.hasNext()) {
+			Path path = paths.next();
+			for (Node node : path.nodes()) {
+				nodeIds.add(node.getId());
+			}
+			for (Relationship rel : path.relationships()) {
+				relationshipIds.add(rel.getId());
+			}
+			lengths[count++] = path.length();
+		}
+		int[] trimmed = new int[count];
+		System.arraycopy(lengths, 0, trimmed, 0, count);
+		return new PathBatch(nodeIds.toArray(), relationshipIds.toArray(), trimmed);
+	}
+	
+	
+	private static class LongList {
+		private long[] values = new long[64];
+		private int size = 0;
+		
+		void add(long value) {
+			if (size == values.length) {
+				long[] grown = new long[size * 2];
+				System.arraycopy(values, 0, grown, 0, size);
+				values = grown;
+			}
+			values[size++] = value;
+		}
+		
+		long[] toArray() {
+			long[] result = new long[size];
+			System.arraycopy(values, 0, result, 0, size);
+			return result;
+		}
+	}
+}
@@ -0,0 +1,19 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+
+
+/**
+ * Condition on a traversal position, built with {@link Predicates} so that
+ * traversals can be filtered without calling back into python.
+ */
+public abstract class PositionPredicate {
+	
+	/**
+	 * @param node the current node
+	 * @param last the last relationship traversed, null at the start node
+	 * @param depth depth of node, 0 at the start node
+	 */
+	public abstract boolean accept(Node node, Relationship last, int depth);
+}
@@ -0,0 +1,20 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Path;
+import org.neo4j.helpers.Predicate;
+
+
+/**
+ * Returns only paths whose end position matches a predicate.
+ */
+public class PredicatePathFilter implements Predicate<Path> {
+	private final PositionPredicate predicate;
+	
+	public PredicatePathFilter(PositionPredicate predicate) {
+		this.predicate = predicate;
+	}
+	
+	public boolean accept(Path path) {
+		return predicate.accept(path.endNode(), path.lastRelationship(), path.length());
+	}
+}
@@ -0,0 +1,20 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Path;
+import org.neo4j.graphdb.traversal.PruneEvaluator;
+
+
+/**
+ * Stops expanding paths whose end position matches a predicate.
+ */
+public class PredicatePruneEvaluator implements PruneEvaluator {
+	private final PositionPredicate predicate;
+	
+	public PredicatePruneEvaluator(PositionPredicate predicate) {
+		this.predicate = predicate;
+	}
+	
+	public boolean pruneAfter(Path path) {
+		return predicate.accept(path.endNode(), path.lastRelationship(), path.length());
+	}
+}
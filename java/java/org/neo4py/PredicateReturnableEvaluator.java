@@ -0,0 +1,17 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.ReturnableEvaluator;
+import org.neo4j.graphdb.TraversalPosition;
+
+
+public class PredicateReturnableEvaluator implements ReturnableEvaluator {
+	private final PositionPredicate predicate;
+	
+	public PredicateReturnableEvaluator(PositionPredicate predicate) {
+		this.predicate = predicate;
+	}
+	
+	public boolean isReturnableNode(TraversalPosition pos) {
+		return predicate.accept(pos.currentNode(), pos.lastRelationshipTraversed(), pos.depth());
+	}
+}
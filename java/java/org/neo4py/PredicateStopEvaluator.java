@@ -0,0 +1,17 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.StopEvaluator;
+import org.neo4j.graphdb.TraversalPosition;
+
+
+public class PredicateStopEvaluator implements StopEvaluator {
+	private final PositionPredicate predicate;
+	
+	public PredicateStopEvaluator(PositionPredicate predicate) {
+		this.predicate = predicate;
+	}
+	
+	public boolean isStopNode(TraversalPosition pos) {
+		return predicate.accept(pos.currentNode(), pos.lastRelationshipTraversed(), pos.depth());
+	}
+}
@@ -0,0 +1,144 @@
+package org.neo4py;
+
+import java.util.HashSet;
+import java.util.Set;
+
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.Relationship;
+
+
+/**
+ * Factories for the {@link PositionPredicate}s behind neo4py.traversal's
+ * Predicate classes.  Property predicates read the current node, and are
+ * false if it doesn't have the property.  Numbers compare by value whatever
+ * their boxed type, as python ints may be stored as Integer or Long.
+ */
+public class Predicates {
+	
+	/**
+	 * True if min <= depth <= max.  A negative max means no upper bound.
+	 */
+	public static PositionPredicate depth(final int min, final int max) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				return depth >= min && (max < 0 || depth <= max);
+			}
+		};
+	}
+	
+	public static PositionPredicate propertyEquals(final String key, final Object value) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				return valuesEqual(node.getProperty(key, null), value);
+			}
+		};
+	}
+	
+	public static PositionPredicate propertyIn(final String key, final Object[] values) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				Object actual = node.getProperty(key, null);
+				for (Object value : values) {
+					if (valuesEqual(actual, value)) {
+						return true;
+					}
+				}
+				return false;
+			}
+		};
+	}
+	
+	/**
+	 * True if low <= property <= high.  A null bound is open.  Values that
+	 * can't be compared with the bounds are not in range.
+	 */
+	public static PositionPredicate propertyRange(final String key, final Object low, final Object high) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				Object actual = node.getProperty(key, null);
+				if (actual == null) {
+					return false;
+				}
+				try {
+					return (low == null || compare(actual, low) >= 0) &&
+						(high == null || compare(actual, high) <= 0);
+				} catch (ClassCastException e) {
+					return false;
+				}
+			}
+		};
+	}
+	
+	public static PositionPredicate lastRelationshipType(String[] types) {
+		final Set<String> names = new HashSet<String>();
+		for (String type : types) {
+			names.add(type);
+		}
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				return last != null && names.contains(last.getType().name());
+			}
+		};
+	}
+	
+	public static PositionPredicate allOf(final PositionPredicate[] predicates) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				for (PositionPredicate predicate : predicates) {
+					if (!predicate.accept(node, last, depth)) {
+						return false;
+					}
+				}
+				return true;
+			}
+		};
+	}
+	
+	public static PositionPredicate anyOf(final PositionPredicate[] predicates) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				for (PositionPredicate predicate : predicates) {
+					if (predicate.accept(node, last, depth)) {
+						return true;
+					}
+				}
+				return false;
+			}
+		};
+	}
+	
+	public static PositionPredicate negate(final PositionPredicate predicate) {
+		return new PositionPredicate() {
+			public boolean accept(Node node, Relationship last, int depth) {
+				return !predicate.accept(node, last, depth);
+			}
+		};
+	}
+	
+	
+	static boolean valuesEqual(Object a, Object b) {
+		if (a == null || b == null) {
+			return a == b;
+		}
+		if (a instanceof Number && b instanceof Number) {
+			return compare(a, b) == 0;
+		}
+		return a.equals(b);
+	}
+	
+	@SuppressWarnings("unchecked")
+	static int compare(Object a, Object b) {
+		if (a instanceof Number && b instanceof Number) {
+			if (isIntegral(a) && isIntegral(b)) {
+				long x = ((Number) a).longValue(), y = ((Number) b).longValue();
+				return x < y ? -1 : (x == y ? 0 : 1);
+			}
+			return Double.compare(((Number) a).doubleValue(), ((Number) b).doubleValue());
+		}
+		return ((Comparable<Object>) a).compareTo(b);
+	}
+	
+	private static boolean isIntegral(Object n) {
+		return n instanceof Long || n instanceof Integer || n instanceof Short || n instanceof Byte;
+	}
+}
@@ -0,0 +1,56 @@
+package org.neo4py;
+
+import java.util.ArrayList;
+import java.util.List;
+
+import org.neo4j.graphdb.GraphDatabaseService;
+import org.neo4j.graphdb.PropertyContainer;
+
+
+/**
+ * All keys and values of a node or relationship, read in a single call.
+ * Keys and values are returned as parallel arrays.
+ */
+public class PropertySnapshot {
+	private final String[] keys;
+	private final Object[] values;
+	
+	public PropertySnapshot(PropertyContainer entity) {
+		List<String> keys = new ArrayList<String>();
+		List<Object> values = new ArrayList<Object>();
+		for (String key : entity.getPropertyKeys()) {
+			keys.add(key);
+			values.add(entity.getProperty(key));
+		}
+		this.keys = keys.toArray(new String[keys.size()]);
+		this.values = values.toArray(new Object[values.size()]);
+	}
+	
+	public String[] getKeys() {
+		return keys;
+	}
+	
+	public Object[] getValues() {
+		return values;
+	}
+	
+	public int size() {
+		return keys.length;
+	}
+	
+	public static PropertySnapshot[] ofNodes(GraphDatabaseService db, long[] ids) {
+		PropertySnapshot[] snapshots = new PropertySnapshot[ids.length];
+		for (int i = 0; i < ids.length; i++) {
+			snapshots[i] = new PropertySnapshot(db.getNodeById(ids[i]));
+		}
+		return snapshots;
+	}
+	
+	public static PropertySnapshot[] ofRelationships(GraphDatabaseService db, long[] ids) {
+		PropertySnapshot[] snapshots = new PropertySnapshot[ids.length];
+		for (int i = 0; i < ids.length; i++) {
+			snapshots[i] = new PropertySnapshot(db.getRelationshipById(ids[i]));
+		}
+		return snapshots;
+	}
+}
@@ -0,0 +1,49 @@
+package org.neo4py;
+
+import org.apache.lucene.search.Sort;
+import org.apache.lucene.search.SortField;
+import org.neo4j.index.impl.lucene.QueryContext;
+
+
+/**
+ * Builds lucene QueryContexts, so sorting can be described with plain strings.
+ */
+public class Queries {
+	/** Sort key for relevance (best first) */
+	public static final String SCORE = "@score";
+	
+	/**
+	 * query (a query string or a lucene Query) with results sorted by the keys
+	 * of sort in turn (a "-" prefix reverses a key), limited to the top hits
+	 * if top > 0.
+	 */
+	public static QueryContext context(Object query, String[] sort, int top,
+			boolean tradeCorrectnessForSpeed) {
+		QueryContext context = new QueryContext(query);
+		if (sort.length > 0) {
+			context.sort(sort(sort));
+		}
+		if (top > 0) {
+			context.top(top);
+		}
+		if (tradeCorrectnessForSpeed) {
+			context.tradeCorrectnessForSpeed();
+		}
+		return context;
+	}
+	
+	private static Sort sort(String[] keys) {
+		SortField[] fields = new SortField[keys.length];
+		for (int i = 0; i < keys.length; i++) {
+			String key = keys[i];
+			boolean reverse = key.startsWith("-");
+			if (reverse) {
+				key = key.substring(1);
+			}
+			fields[i] = SCORE.equals(key) ?
+				new SortField(null, SortField.SCORE, reverse) :
+				new SortField(key, SortField.STRING, reverse);
+		}
+		return new Sort(fields);
+	}
+}
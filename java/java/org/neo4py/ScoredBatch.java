@@ -0,0 +1,72 @@
+package org.neo4py;
+
+import org.neo4j.graphdb.Node;
+import org.neo4j.graphdb.PropertyContainer;
+import org.neo4j.graphdb.Relationship;
+import org.neo4j.graphdb.index.IndexHits;
+
+
+/**
+ * The next (up to) max hits of an IndexHits with their scores, so python
+ * doesn't need a call to currentScore() per hit.
+ */
+public class ScoredBatch {
+	private final PropertyContainer[] items;
+	private final long[] ids;
+	private final float[] scores;
+	
+	private ScoredBatch(PropertyContainer[] items, long[] ids, float[] scores) {
+		this.items = items;
+		this.ids = ids;
+		this.scores = scores;
+	}
+	
+	/** The hits, or null if the batch was read with ids only */
+	public PropertyContainer[] getItems() {
+		return items;
+	}
+	
+	public long[] getIds() {
+		return ids;
+	}
+	
+	public float[] getScores() {
+		return scores;
+	}
+	
+	public int size() {
+		return ids.length;
+	}
+	
+	/**
+	 * An empty batch means the hits are exhausted.  If withItems is false only
+	 * ids and scores are kept.
+	 */
+	public static ScoredBatch next(IndexHits<? extends PropertyContainer> hits, int max, boolean withItems) {
+		PropertyContainer[] items = withItems ? new PropertyContainer[max] : null;
+		long[] ids = new long[max];
+		float[] scores = new float[max];
+		int count = 0;
+		while (count < max && hits.hasNext()) {
+			PropertyContainer item = hits.next();
+			if (withItems) {
+				items[count] = item;
+			}
+			ids[count] = item instanceof Node ? ((Node) item).getId() : ((Relationship) item).getId();
+			scores[count++] = hits.currentScore();
+		}
+		if (count == max) {
+			return new ScoredBatch(items, ids, scores);
+		}
+		PropertyContainer[] trimmedItems = null;
+		if (withItems) {
+			trimmedItems = new PropertyContainer[count];
+			System.arraycopy(items, 0, trimmedItems, 0, count);
+		}
+		long[] trimmedIds = new long[count];
+		float[] trimmedScores = new float[count];
+		System.arraycopy(ids, 0, trimmedIds, 0, count);
+		System.arraycopy(scores, 0, trimmedScores, 0, count);
+		return new ScoredBatch(trimmedItems, trimmedIds, trimmedScores);
+	}
+}
@@ -22,8 +22,8 @@ echo "Neo4j path: $NEO4J_PATH"
 
 mkdir -p build/java-classes
 mkdir lib
-javac -d build/java-classes -classpath "${NEO4J_PATH}/lib/neo4j-kernel-1.3.jar" @classes.txt
-jar cf lib/neo4j-python-exts.jar -C build/java-classes org
+javac -d build/java-classes -classpath "${NEO4J_PATH}/lib/neo4j-kernel-1.3.jar:${NEO4J_PATH}/lib/neo4j-lucene-index-1.3.jar:${NEO4J_PATH}/lib/org.apache.servicemix.bundles.lucene-3.0.1_2.jar" @classes.txt
+jar cf lib/neo4j-neo4py-exts.jar -C build/java-classes org
 
 
 exit 0
@@ -37,7 +37,8 @@ python -m $JCC_MOD	\
         --include ${NEO4J_PATH}/lib/geronimo-jta_1.1_spec-1.1.1.jar	\
         --include ${NEO4J_PATH}/lib/neo4j-lucene-index-1.3.jar	\
         --include ${NEO4J_PATH}/lib/org.apache.servicemix.bundles.lucene-3.0.1_2.jar	\
-        --jar lib/neo4j-python-exts.jar		\
+        --include ${NEO4J_PATH}/lib/neo4j-graph-algo-1.3.jar	\
+        --jar lib/neo4j-neo4py-exts.jar		\
         --package java.lang			\
         --package java.util			\
         --package javax.transaction		\
@@ -45,10 +46,20 @@ python -m $JCC_MOD	\
         --package org.neo4j.graphdb		\
         --package org.neo4j.graphdb.index	\
         --package org.neo4j.index.impl.lucene	\
+        --package org.neo4j.kernel.impl.batchinsert	\
+        --package org.neo4j.graphdb.traversal	\
+        --package org.neo4j.helpers		\
+        --package org.neo4j.graphalgo		\
         org.neo4j.kernel.EmbeddedGraphDatabase		\
         org.neo4j.graphdb.DynamicRelationshipType	\
         org.neo4j.graphdb.index.IndexManager		\
         org.neo4j.index.impl.lucene.LuceneIndexProvider	\
+        org.neo4j.kernel.impl.batchinsert.BatchInserterImpl	\
+        org.neo4j.index.impl.lucene.LuceneBatchInserterIndexProvider	\
+        org.neo4j.kernel.Traversal		\
+        org.neo4j.kernel.Uniqueness		\
+        org.neo4j.graphalgo.GraphAlgoFactory	\
+        org.neo4j.graphalgo.CommonEvaluators	\
         java.util.HashMap			\
         --exclude RelationshipIndex		\
         --version 1.3				\
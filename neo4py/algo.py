@@ -0,0 +1,104 @@
+# Copyright (c) 2011 "Aaron Moffatt"
+# aaronmoffatt.com
+# 
+# This file is part of Neo4py.
+# 
+# Neo4py is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# 
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''Path finding with Neo4j's graph algorithms (org.neo4j.graphalgo), run entirely in
+the JVM.  types are given as for TraversalDescription.expand(): Direction.X.TYPE,
+relationship type names (followed in both directions), or a java RelationshipExpander.
+All types are followed if none are given.'''
+
+from backend import neo4j
+from traversal import Path, expander, iter_paths, to_path
+
+__all__ = "shortest_path", "all_shortest_paths", "all_simple_paths", "dijkstra", "astar", \
+          "geo_estimator", "WeightedPath"
+
+DEFAULT_MAX_DEPTH = 15
+
+
+class WeightedPath(Path):
+    '''Path found by dijkstra() or astar(), with its total cost'''
+    __slots__ = 'weight',
+    
+    def __init__(self, java_gdb, node_ids, relationship_ids, weight=None):
+        super(WeightedPath, self).__init__(java_gdb, node_ids, relationship_ids)
+        self.weight = weight
+
+
+def shortest_path(start, end, types=(), max_depth=DEFAULT_MAX_DEPTH):
+    '''A shortest Path from start to end, or None'''
+    finder = neo4j.GraphAlgoFactory.shortestPath(expander(*types), max_depth)
+    return _single_path(finder, start, end)
+
+def all_shortest_paths(start, end, types=(), max_depth=DEFAULT_MAX_DEPTH):
+    '''Iterator over all shortest Paths from start to end'''
+    finder = neo4j.GraphAlgoFactory.shortestPath(expander(*types), max_depth)
+    return _all_paths(finder, start, end)
+
+def all_simple_paths(start, end, types=(), max_depth=DEFAULT_MAX_DEPTH):
+    '''Iterator over all Paths from start to end, up to max_depth long, which
+    don't visit any node twice'''
+    finder = neo4j.GraphAlgoFactory.allSimplePaths(expander(*types), max_depth)
+    return _all_paths(finder, start, end)
+
+def dijkstra(start, end, cost_property, types=()):
+    '''Cheapest WeightedPath from start to end, with relationship costs read from
+    their cost_property (a number), or None'''
+    finder = neo4j.GraphAlgoFactory.dijkstra(expander(*types), _cost_evaluator(cost_property))
+    return _single_weighted_path(finder, start, end)
+
+def astar(start, end, cost_property, estimator, types=()):
+    '''Cheapest WeightedPath from start to end as with dijkstra(), guided by
+    estimator, a java EstimateEvaluator such as geo_estimator()'''
+    finder = neo4j.GraphAlgoFactory.aStar(expander(*types), _cost_evaluator(cost_property), estimator)
+    return _single_weighted_path(finder, start, end)
+
+def geo_estimator(latitude_property, longitude_property):
+    '''A* estimator using the distance between nodes' coordinates'''
+    return neo4j.CommonEvaluators.geoEstimateEvaluator(latitude_property, longitude_property)
+
+
+def _cost_evaluator(cost_property):
+    if neo4j.CostEvaluator.instance_(cost_property):
+        return cost_property
+    return neo4j.CommonEvaluators.doubleCostEvaluator(cost_property)
+
+def _jnode(node):
+    return getattr(node, '__jobj__', node)
+
+def _single_path(finder, start, end):
+    jstart = _jnode(start)
+    jpath = finder.findSinglePath(jstart, _jnode(end))
+    if jpath is None:
+        return None
+    return to_path(neo4j.Path.cast_(jpath), jstart.getGraphDatabase())
+
+def _single_weighted_path(finder, start, end):
+    jstart = _jnode(start)
+    jpath = finder.findSinglePath(jstart, _jnode(end))
+    if jpath is None:
+        return None
+    jpath = neo4j.WeightedPath.cast_(jpath)
+    path = to_path(jpath, jstart.getGraphDatabase(), WeightedPath)
+    path.weight = jpath.weight()
+    return path
+
+def _all_paths(finder, start, end):
+    jstart = _jnode(start)
+    return iter_paths(finder.findAllPaths(jstart, _jnode(end)).iterator(), jstart.getGraphDatabase())
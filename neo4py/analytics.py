@@ -0,0 +1,164 @@
+# Copyright (c) 2011 "Aaron Moffatt"
+# aaronmoffatt.com
+# 
+# This file is part of Neo4py.
+# 
+# Neo4py is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# 
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+'''Whole graph analytics on numpy arrays.  The topology is exported once with
+GraphDatabase.to_csr(), and the algorithms run on that, without touching the
+JVM again.  numpy is required.'''
+
+from backend import neo4j
+from util import numpy
+from core import Direction, type_names
+
+__all__ = "CSRGraph", "to_csr", "pagerank", "weakly_connected_components", "degrees", "degree_histogram"
+
+EDGE_BATCH_SIZE = 100000
+
+
+class CSRGraph(object):
+    '''Adjacency of a graph in compressed sparse row form.  Row i is the node with
+    id node_ids[i], and its neighbours are the rows indices[indptr[i]:indptr[i+1]],
+    with edge weights at the same positions of data (None if no weight was read)'''
+    def __init__(self, node_ids, indptr, indices, data=None):
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        
+    def rows(self, ids):
+        '''Rows of an array of node ids'''
+        return numpy.searchsorted(self.node_ids, ids)
+    
+    def row(self, id):
+        row = int(numpy.searchsorted(self.node_ids, id))
+        if row == len(self.node_ids) or self.node_ids[row] != id:
+            raise KeyError(id)
+        return row
+    
+    def neighbors(self, row):
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+    
+    @property
+    def num_nodes(self):    return len(self.node_ids)
+    @property
+    def num_edges(self):    return len(self.indices)
+    
+    def __len__(self):
+        return self.num_nodes
+    
+    
+def to_csr(java_gdb, types=(), direction=Direction.Outgoing, weight=None, batch_size=EDGE_BATCH_SIZE):
+    '''CSRGraph of the relationships of types (names or RelationshipTypes, all types
+    if empty) in a java graph.  With Direction.Outgoing a row's neighbours are the
+    end nodes of its relationships, with Direction.Incoming their start nodes, and
+    with Direction.Both both.  If weight is given, data holds that (number) property
+    of each relationship, or 1.0 where it is missing'''
+    if numpy is None:
+        raise ImportError("numpy is required for neo4py.analytics")
+    node_ids = numpy.sort(numpy.array(neo4j.EdgeCursor.nodeIds(java_gdb)[:], dtype=numpy.int64))
+    
+    cursor = neo4j.EdgeCursor(java_gdb, type_names(types), weight)
+    starts, ends, weights = [], [], []
+    while cursor.next(batch_size):
+        starts.append(numpy.array(cursor.getStarts()[:], dtype=numpy.int64))
+        ends.append(numpy.array(cursor.getEnds()[:], dtype=numpy.int64))
+        if weight is not None:
+            weights.append(numpy.array(cursor.getWeights()[:], dtype=numpy.float64))
+    
+    starts = numpy.searchsorted(node_ids, _concat(starts, numpy.int64))
+    ends = numpy.searchsorted(node_ids, _concat(ends, numpy.int64))
+    weights = _concat(weights, numpy.float64) if weight is not None else None
+    if direction is Direction.Outgoing:
+        src, dst = starts, ends
+    elif direction is Direction.Incoming:
+        src, dst = ends, starts
+    else:
+        src, dst = numpy.concatenate((starts, ends)), numpy.concatenate((ends, starts))
+        if weights is not None:
+            weights = numpy.concatenate((weights, weights))
+    
+    order = numpy.argsort(src, kind='mergesort')
+    indptr = numpy.zeros(len(node_ids) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+    return CSRGraph(node_ids, indptr, dst[order],
+                    weights[order] if weights is not None else None)
+
+def _concat(arrays, dtype):
+    if not arrays:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.concatenate(arrays)
+
+
+def degrees(csr):
+    '''Number of neighbours of each row'''
+    return numpy.diff(csr.indptr)
+
+def degree_histogram(csr):
+    '''hist[d] is the number of rows with d neighbours'''
+    return numpy.bincount(degrees(csr))
+
+def pagerank(csr, damping=0.85, tolerance=1e-6, max_iterations=100, weighted=False):
+    '''PageRank of each row, following edges from a row to its neighbours (so use a
+    Direction.Outgoing CSRGraph).  Rank of rows without neighbours is spread evenly
+    over all rows.  If weighted, a row's rank is split in proportion to csr.data, rows
+    whose weights sum to 0 being treated as having no neighbours'''
+    n = csr.num_nodes
+    if not n:
+        return numpy.zeros(0)
+    out_degree = degrees(csr)
+    src = numpy.repeat(numpy.arange(n), out_degree)
+    if weighted and csr.data is not None:
+        out_weight = numpy.bincount(src, weights=csr.data, minlength=n)
+        dangling = out_weight == 0          # rows whose weights sum to 0 count as dangling
+        share = numpy.zeros(len(src))
+        weighted_edge = ~dangling[src]
+        share[weighted_edge] = csr.data[weighted_edge] / out_weight[src][weighted_edge]
+    else:
+        share = 1.0 / out_degree[src] if len(src) else numpy.zeros(0)
+        dangling = out_degree == 0
+    
+    rank = numpy.empty(n)
+    rank.fill(1.0 / n)
+    for i in xrange(max_iterations):
+        spread = numpy.bincount(csr.indices, weights=rank[src] * share, minlength=n)
+        new_rank = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+        delta = numpy.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tolerance:
+            break
+    return rank
+
+def weakly_connected_components(csr):
+    '''Component label of each row, ignoring edge direction.  Rows with the same
+    label are connected; the label is the smallest row in the component'''
+    n = csr.num_nodes
+    src = numpy.repeat(numpy.arange(n), degrees(csr))
+    dst = csr.indices
+    labels = numpy.arange(n)
+    while True:
+        previous = labels.copy()
+        numpy.minimum.at(labels, src, labels[dst])
+        numpy.minimum.at(labels, dst, labels[src])
+        while True:                     # point every row at its label's label
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+        if (labels == previous).all():
+            return labels
@@ -17,9 +17,30 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import threading
 import neo4jcc as neo4j
 neo4j.initVM()
 
+_thread_state = threading.local()
+
+def attach_thread(daemon=False):
+    '''Attaches the calling thread to the JVM, which must be done before a thread
+    other than the one that imported neo4py touches any java object.  Cheap to
+    call repeatedly'''
+    if getattr(_thread_state, 'attached', False):
+        return
+    env = neo4j.getVMEnv()
+    if not env.isCurrentThreadAttached():
+        env.attachCurrentThread(threading.current_thread().name, daemon)
+        _thread_state.detach = True
+    _thread_state.attached = True
+
+def detach_thread():
+    '''Detaches the calling thread, if it was attached by attach_thread()'''
+    if getattr(_thread_state, 'detach', False):
+        neo4j.getVMEnv().detachCurrentThread()
+    _thread_state.attached = _thread_state.detach = False
+
 _rel_types = {}
 
 def rel_type(name):
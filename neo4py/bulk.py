@@ -0,0 +1,211 @@
+# Copyright (c) 2011 "Aaron Moffatt"
+# aaronmoffatt.com
+# 
+# This file is part of Neo4py.
+# 
+# Neo4py is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# 
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''Offline bulk loading of a new store, without transactions.  The store must not
+be open by a GraphDatabase while a BatchInserter is in use, and shutdown() must be
+called for the store to be usable afterwards.'''
+
+from __future__ import with_statement
+import csv
+import json
+from backend import neo4j, rel_type
+from util import props_to_jmap, jmap_to_dict, dict_to_jmap, java_to_py, entity_id
+
+__all__ = "BatchInserter", "read_csv", "read_jsonl"
+
+
+class BatchInserter(object):
+    def __init__(self, store_dir):
+        self.__neo__ = neo4j.BatchInserterImpl(store_dir)
+        self._index_provider = None
+        self._running = True
+
+    def node(self, **kwargs):
+        '''Creates a node and returns its id'''
+        return self.__neo__.createNode(props_to_jmap(kwargs))
+
+    def relationship(self, start, type, end, **kwargs):
+        '''Creates a relationship between start and end (nodes ids) and returns its id'''
+        return self.__neo__.createRelationship(entity_id(start), entity_id(end),
+                                               rel_type(getattr(type, 'name', type)),
+                                               props_to_jmap(kwargs))
+
+    def node_properties(self, id):
+        return jmap_to_dict(self.__neo__.getNodeProperties(id))
+
+    def set_node_properties(self, id, props):
+        self.__neo__.setNodeProperties(id, props_to_jmap(props))
+
+    def relationship_properties(self, id):
+        return jmap_to_dict(self.__neo__.getRelationshipProperties(id))
+
+    def set_relationship_properties(self, id, props):
+        self.__neo__.setRelationshipProperties(id, props_to_jmap(props))
+
+    def node_exists(self, id):
+        return self.__neo__.nodeExists(id)
+
+    @property
+    def reference_node(self):   return self.__neo__.getReferenceNode()
+
+    @property
+    def store_dir(self):        return self.__neo__.getStoreDir()
+
+    @property
+    def node_indices(self):
+        return BatchIndexFactory(self._get_index_provider(), nodes=True)
+
+    @property
+    def rel_indices(self):
+        return BatchIndexFactory(self._get_index_provider(), nodes=False)
+
+    def _get_index_provider(self):
+        if self._index_provider is None:
+            self._index_provider = neo4j.LuceneBatchInserterIndexProvider(self.__neo__)
+        return self._index_provider
+
+    def load_nodes(self, rows, id_key=None, index=None, index_keys=()):
+        '''Creates a node for each property dict in rows.  index_keys properties are
+        added to index, if given.  If id_key is given, that property is taken as the
+        row's external id and a dict of external id => node id is returned, for use
+        with load_relationships().  Otherwise the number of nodes created is returned'''
+        create = self.__neo__.createNode
+        id_map = {}
+        count = 0
+        for row in rows:
+            node_id = create(props_to_jmap(row))
+            if index is not None and index_keys:
+                index.add(node_id, dict((k, row[k]) for k in index_keys if k in row))
+            if id_key is not None:
+                id_map[row[id_key]] = node_id
+            count += 1
+        return id_map if id_key is not None else count
+
+    def load_relationships(self, rows, id_map=None, start_key='start', type_key='type', end_key='end'):
+        '''Creates a relationship for each dict in rows.  The start, type and end entries
+        are removed and the rest stored as properties.  If id_map is given, start and end
+        are looked up in it, else they must be node ids.  Returns the number created'''
+        create = self.__neo__.createRelationship
+        count = 0
+        for row in rows:
+            row = dict(row)
+            start, type, end = row.pop(start_key), row.pop(type_key), row.pop(end_key)
+            if id_map is not None:
+                start, end = id_map[start], id_map[end]
+            create(long(start), long(end), rel_type(type), props_to_jmap(row))
+            count += 1
+        return count
+
+    def shutdown(self):
+        self._running = False
+        if self._index_provider is not None:
+            self._index_provider.shutdown()
+        self.__neo__.shutdown()
+
+    @property
+    def running(self):      return self._running
+    def __nonzero__(self):  return self._running
+
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+
+class BatchIndexFactory(object):
+    def __init__(self, java_index_provider, nodes=True):
+        self.__iprovider__ = java_index_provider
+        self._nodes = nodes
+
+    def create(self, name, fulltext=False, provider="lucene"):
+        '''Existing indices with the same name are opened rather than recreated'''
+        itype = 'fulltext' if fulltext else 'exact'
+        params = dict_to_jmap({
+                    'provider'  : provider,
+                    'type'      : itype
+                })
+        if self._nodes:
+            return BatchIndex(self.__iprovider__.nodeIndex(name, params))
+        return BatchIndex(self.__iprovider__.relationshipIndex(name, params))
+    get_or_create = create
+
+
+class BatchIndex(object):
+    '''Mirrors NodeIndex/RelationshipIndex, but takes and returns entity ids.  Entries
+    are only visible to get()/query() after flush()'''
+    def __init__(self, java_index):
+        self.__jobj__ = java_index
+
+    def __setitem__(self, (key, value), entity):
+        self.add(entity, {key: value})
+
+    def add(self, entity, props):
+        self.__jobj__.add(entity_id(entity), props_to_jmap(props))
+
+    def update_or_add(self, entity, props):
+        self.__jobj__.updateOrAdd(entity_id(entity), props_to_jmap(props))
+
+    def get(self, key, value):
+        return self._ids(self.__jobj__.get(key, value))
+
+    def __getitem__(self, (key, value)):
+        return self.get(key, value)
+
+    def query(self, query):
+        return self._ids(self.__jobj__.query(query))
+
+    def simple_query(self, key, value):
+        return self._ids(self.__jobj__.query(key, value))
+
+    def flush(self):
+        self.__jobj__.flush()
+
+    def cache(self, key, size):
+        '''Caches lookups for key, which greatly speeds up get() while loading'''
+        self.__jobj__.setCacheCapacity(key, size)
+
+    def _ids(self, hits):
+        try:
+            return [java_to_py(id) for id in hits]
+        finally:
+            hits.close()
+
+
+def read_csv(path, converters=None, encoding='utf-8', **csv_kwargs):
+    '''Streams rows of a CSV file with a header line as dicts.  Empty fields are
+    skipped.  converters may map column names to functions, eg. {'age': int}'''
+    converters = converters or {}
+    with open(path, 'rb') as f:
+        for row in csv.DictReader(f, **csv_kwargs):
+            props = {}
+            for k, v in row.iteritems():
+                if not v:
+                    continue
+                v = v.decode(encoding)
+                convert = converters.get(k)
+                props[k.decode(encoding)] = convert(v) if convert else v
+            yield props
+
+def read_jsonl(path):
+    '''Streams a file of one JSON object per line as dicts'''
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
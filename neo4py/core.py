@@ -17,15 +17,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import threading
 from itertools import islice
 from backend import neo4j, rel_type, JTypes
-from util import transactional, fancy_property, cached_property, BufferedIterator, java_to_py
+from util import transactional, fancy_property, cached_property, BufferedIterator, java_to_py, snapshot_to_dict, \
+                 py_to_java, properties_to_jarrays, count_ops, on_finish, notify_delete, LRUCache, iter_ids, \
+                 id_chunks, ITER_BUFFER_SIZE, BULK_CHUNK_SIZE
 #from helpers import create_traverser
 
-__all__ = 'Direction', 'DirectedRelationshipType' 'PropertyContainer', 'Node', 'Relationship', 'NodeIterator', 'RelationshipIterator'
+__all__ = 'Direction', 'DirectedRelationshipType' 'PropertyContainer', 'Node', 'Relationship', 'NodeIterator', 'RelationshipIterator', \
+          'IdentityMap', 'wrap_node', 'wrap_relationship'
+
+IDENTITY_MAP_SIZE = 10000
 
         
 class _Direction(object):
+    __slots__ = '__jobj__', '_cached_name'
+    
     def __init__(self, java_direction):
         self.__jobj__ = java_direction
     def __call__(self, type):
@@ -67,9 +75,24 @@ class DirectedRelationshipType(RelationshipType):
         return "<%s (%s)>" % (self.name, self.direction.name)
         
 
+def type_names(types):
+    '''String[] of relationship type names, for the org.neo4py helpers'''
+    return neo4j.JArray('string')([getattr(t, 'name', t) for t in types])
+
+def relationship_types(types):
+    '''RelationshipType[] of types (names or RelationshipTypes), from the cache of
+    rel_type(), for the org.neo4py helpers'''
+    jtypes = [(t if isinstance(t, RelationshipType) else RelationshipType(t)).__jobj__ for t in types]
+    return neo4j.JArray('object')(jtypes, neo4j.RelationshipType)
+
+
 class PropertyContainer(object):
+    # wrappers are kept small, as millions may be alive during traversals and exports
+    __slots__ = '__jobj__', '_props', '_cached_id', '_cached___neo__'
+    
     def __init__(self, java_container):
         self.__jobj__ = java_container
+        self._props = None      # property value cache, only used for wrappers from an IdentityMap
 
     @cached_property
     def id(self):               return self.__jobj__.getId()
@@ -78,22 +101,37 @@ class PropertyContainer(object):
     def __neo__(self):          return self.__jobj__.getGraphDatabase()
         
     def __getitem__(self, k):
+        props = self._props
+        if props is not None and k in props:
+            return props[k]
         try:
-            return java_to_py(self.__jobj__.getProperty(k))     #TODO support array types
+            value = java_to_py(self.__jobj__.getProperty(k))
         except:
             raise KeyError(k)
+        if props is not None:
+            props[k] = value
+        return value
         
     def __setitem__(self, k,v):
+        if self._props is not None:
+            self._props.pop(k, None)
         try:
-            self.__jobj__.setProperty(k,v)     #TODO support array types
-        except:
-            raise TypeError("Value of unsupported type: %s" % (v))
+            jv = py_to_java(v)     #TODO support array types
+        except TypeError:
+            raise TypeError("Value of unsupported type for property '%s': %r" % (k, v))
+        self.__jobj__.setProperty(k, jv)     # java errors (eg. a deadlock) propagate, so can be retried
+        count_ops()
         
     def __contains__(self, k):
+        if self._props is not None and k in self._props:
+            return True
         return self.__jobj__.hasProperty(k)
     
     def __delitem__(self, k):
+        if self._props is not None:
+            self._props.pop(k, None)
         self.__jobj__.removeProperty(k)
+        count_ops()
         
     def __iter__(self):
         return iter(self.__jobj__.propertyKeys)
@@ -105,17 +143,37 @@ class PropertyContainer(object):
             return default
     
     def update(self, *args, **kwargs):
+        '''Sets all given properties in a single call to the JVM'''
+        props = {}
         for d in args:
             if d:
-                for k,v in d.iteritems():
-                    self[k] = v
-        
-        for k,v in kwargs.iteritems():
-            self[k] = v
+                props.update(d)
+        props.update(kwargs)
+        count = self._set_properties(props)
+        if count:
+            count_ops(count)
+    
+    def _set_properties(self, props):
+        '''Sets props without counting the writes, returning how many were set'''
+        if not props:
+            return 0
+        keys, values = properties_to_jarrays(props)
+        if self._props is not None:
+            for k in props:
+                self._props.pop(k, None)
+        neo4j.EntityCreator.setProperties(self.__jobj__, keys, values)
+        return len(props)
             
     def iteritems(self):
-        for k in self:
-            yield k, self[k]
+        return self.to_dict().iteritems()
+
+    def to_dict(self):
+        '''All properties as a dict, read from the JVM in a single call'''
+        props = snapshot_to_dict(neo4j.PropertySnapshot(self.__jobj__))
+        if self._props is not None:
+            self._props = dict(props)
+        return props
+    snapshot = to_dict
             
     def __len__(self):      ##NOTE not efficient, but caching would also cause issues
         cnt = 0
@@ -131,10 +189,15 @@ class PropertyContainer(object):
             return "%s<%d>(%d properties)" % (self.__class__.__name__, self.id, len(self))
     
 class Node(PropertyContainer):
+    __slots__ = ()
+    
     def __init__(self, java_node):
         super(Node, self).__init__(java_node)
 
-    def delete(self):           return self.__jobj__.delete()     #TODO may need to add relationship deletion here
+    def delete(self):           #TODO may need to add relationship deletion here
+        self.__jobj__.delete()
+        notify_delete()
+        count_ops()
     
     #def remove(self):            #method to remove relationships AND delete?
     
@@ -142,6 +205,46 @@ class Node(PropertyContainer):
         rel_types = [RelationshipType(t) for t in types]
         return RelationshipFactory(self.__jobj__, Direction.Both, rel_types)
 
+    def degree(self, *types, **kwargs):
+        '''Number of relationships of types (all types if none are given), counted
+        in the JVM.  Takes a direction keyword argument, Direction.Both by default'''
+        direction = kwargs.pop('direction', Direction.Both)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: %s" % ', '.join(kwargs))
+        return neo4j.Degrees.degree(self.__jobj__, relationship_types(types), direction.__jobj__)
+
+    def neighbors(self, *types, **kwargs):
+        '''Yields an (id, props) tuple for each node related to this one by a relationship
+        of types (all types if none are given), props being a dict of those of the
+        requested properties the neighbour has.  Neighbours and properties are read in
+        the JVM, buffer_size at a time.  Keyword arguments: direction (Direction.Both by
+        default), props (a list of property keys), limit and buffer_size'''
+        direction = kwargs.pop('direction', Direction.Both)
+        keys = list(kwargs.pop('props', None) or ())
+        limit = kwargs.pop('limit', None)
+        buffer_size = kwargs.pop('buffer_size', ITER_BUFFER_SIZE)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: %s" % ', '.join(kwargs))
+        
+        cursor = neo4j.NeighborCursor(self.__jobj__, direction.__jobj__, relationship_types(types),
+                                      neo4j.JArray('string')(keys), -1 if limit is None else limit)
+        width = len(keys)
+        while True:
+            count = cursor.next(buffer_size)
+            if not count:
+                break
+            ids = cursor.getIds()[:]
+            values = cursor.getValues()[:]
+            for i in xrange(count):
+                props = {}
+                for k in xrange(width):
+                    value = values[i * width + k]
+                    if value is not None:
+                        props[keys[k]] = java_to_py(value)
+                yield ids[i], props
+            if count < buffer_size:
+                break
+    
     def __hash__(self): return self.id
     
     def __eq__(self, other):
@@ -164,6 +267,8 @@ class Node(PropertyContainer):
          
         
 class Relationship(PropertyContainer):
+    __slots__ = '_cached_type', '_cached_start', '_cached_end', '_cached_other', '_cached_nodes'
+    
     def __init__(self, java_relationship):
         super(Relationship, self).__init__(java_relationship)
     
@@ -171,13 +276,13 @@ class Relationship(PropertyContainer):
     def type(self):     return self.__jobj__.getType().name()
     
     @cached_property
-    def start(self):    return Node(self.__jobj__.getStartNode())
+    def start(self):    return wrap_node(self.__jobj__.getStartNode())
     
     @cached_property
-    def end(self):      return Node(self.__jobj__.getEndNode())
+    def end(self):      return wrap_node(self.__jobj__.getEndNode())
     
     @cached_property
-    def other(self):    return Node(self.__jobj__.getOtherNode())
+    def other(self):    return wrap_node(self.__jobj__.getOtherNode())
     
     @cached_property
     def nodes(self):    return (self.start, self.end)
@@ -185,7 +290,10 @@ class Relationship(PropertyContainer):
     def istype(self, tp_name):
         return self.__jobj__.isType(rel_type(tp_name))
     
-    def delete(self):   self.__jobj__.delete()
+    def delete(self):
+        self.__jobj__.delete()
+        notify_delete()
+        count_ops()
     
     def __hash__(self): return self.id
     
@@ -197,37 +305,38 @@ class Relationship(PropertyContainer):
     
 
 class RelationshipFactory(object):
-    def __init__(self, java_node, dir, types):
+    def __init__(self, java_node, dir, types, jtypes=None):
         self.__jn__ = java_node
         self.__jdir = dir.__jobj__
         self.__types = types
+        if jtypes is None:      # RelationshipType[] for the org.neo4py helpers, shared with derived factories
+            jtypes = neo4j.JArray('object')([t.__jobj__ for t in types], neo4j.RelationshipType)
+        self.__jtypes = jtypes
         if len(types) == 1:
             self.__jsingle_type = self.__types[0].__jobj__
         else:
             self.__jsingle_type = None
+            
     def _get_relationships(self):
-        if not self.__types:
-            for rel in self.__jn__.getRelationships(self.__jdir):
-                yield rel
-        elif len(self.__types) > 1:
-            for type in self.__types:
-                for rel in self.__jn__.getRelationships(type, self.__jdir):
-                    yield rel
-        else:
-            for rel in self.__jn__.getRelationships(self.__jsingle_type,
-                                                    self.__jdir):
-                yield rel
+        '''All matching relationships as a single java iterator'''
+        return neo4j.Buffers.relationships(self.__jn__, self.__jdir, self.__jtypes)
+    
     def _has_relationship(self):
-        if not self.__types:
-            return self.__jn__.hasRelationship(self.__jdir)
-        elif len(self.__types) > 1:
-            for type in self.__types:
-                if self.__jn__.hasRelationship(type, self.__jdir):
-                    return True
-            return False
-        else:
-            return self.__jn__.hasRelationship(self.__jsingle_type,
-                                               self.__jdir)
+        return neo4j.Buffers.hasRelationship(self.__jn__, self.__jdir, self.__jtypes)
+    
+    def count(self):
+        '''Number of relationships, counted in the JVM'''
+        return neo4j.Degrees.degree(self.__jn__, self.__jtypes, self.__jdir)
+    
+    def ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''Ids of the relationships, read chunk_size at a time without creating
+        Relationship objects'''
+        return iter_ids(self._get_relationships(), chunk_size)
+    
+    def id_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        '''Ids of the relationships in arrays, see util.id_chunks()'''
+        return id_chunks(self._get_relationships(), chunk_size, format)
+    
     def __single(self):
         if not self.__jsingle_type:
             raise TypeError("No single relationship type!")
@@ -248,12 +357,18 @@ class RelationshipFactory(object):
         else:
             relationship = self.__jn__.createRelationshipTo(
                 jnode, self.__jsingle_type)
-        relationship = Relationship(relationship)
-        relationship.update(attributes)
+        relationship = wrap_relationship(relationship)
+        count_ops(1 + relationship._set_properties(attributes))
         return relationship
     
     def __iter__(self):
-        return iter(RelationshipIterator(self._get_relationships()))
+        rels = self._get_relationships()
+        while True:
+            buffer = neo4j.Buffers.nextRelationships(rels, ITER_BUFFER_SIZE)
+            for jrel in buffer:
+                yield wrap_relationship(jrel)
+            if len(buffer) < ITER_BUFFER_SIZE:
+                break
     
     def __nonzero__(self):
         return self._has_relationship()
@@ -264,7 +379,7 @@ class RelationshipFactory(object):
         def fget(self):
             single = self.__single()
             if single:
-                return Relationship(single)
+                return wrap_relationship(single)
     
         def fset(self, node):
             del self.single
@@ -272,24 +387,96 @@ class RelationshipFactory(object):
 
         def fdel(self):
             single = self.__single()
-            if single: single.delete()
+            if single: wrap_relationship(single).delete()
         
     @property
     def incoming(self):
         return RelationshipFactory(self.__jn__,
-                                   Direction.Incoming, self.__types)
+                                   Direction.Incoming, self.__types, self.__jtypes)
     @property
     def outgoing(self):
         return RelationshipFactory(self.__jn__,
-                                   Direction.Outgoing, self.__types)
+                                   Direction.Outgoing, self.__types, self.__jtypes)
 
     
 class NodeIterator(BufferedIterator):
     def __init__(self, *java_node_iters, **kwargs):
-        super(NodeIterator, self).__init__(constructor=Node, *java_node_iters, **kwargs)
+        super(NodeIterator, self).__init__(constructor=wrap_node, *java_node_iters, **kwargs)
 
 class RelationshipIterator(BufferedIterator):
     def __init__(self, *java_rel_iters, **kwargs):
-        super(RelationshipIterator, self).__init__(constructor=Relationship, *java_rel_iters, **kwargs)
+        super(RelationshipIterator, self).__init__(constructor=wrap_relationship, *java_rel_iters, **kwargs)
+
+
+class IdentityMap(object):
+    '''While active in a thread (in a with block), nodes and relationships read
+    through neo4py are returned as the same wrapper object for each id, and those
+    wrappers cache property values.  A wrapper's cache is kept up to date by its
+    own writes; writes through other wrappers or threads are not seen.  The least
+    recently used wrappers are dropped once max_size is reached, and everything is
+    dropped when a transaction of a thread the map is active in is rolled back'''
+    _state = threading.local()
     
+    def __init__(self, max_size=IDENTITY_MAP_SIZE):
+        self._nodes = LRUCache(max_size)
+        self._rels = LRUCache(max_size)
+        self._previous = None
         
+    @classmethod
+    def current(cls):
+        '''Identity map active in the calling thread, or None'''
+        return getattr(cls._state, 'map', None)
+        
+    def node(self, java_node):
+        return self._get(self._nodes, java_node, Node)
+    
+    def relationship(self, java_rel):
+        return self._get(self._rels, java_rel, Relationship)
+    
+    def _get(self, entries, jobj, cls):
+        id = jobj.getId()
+        entity = entries.get(id)
+        if entity is None:
+            entity = entries[id] = cls(jobj)
+            entity._props = {}
+        return entity
+    
+    def invalidate(self):
+        self._nodes.clear()
+        self._rels.clear()
+    clear = invalidate
+    
+    def tx_finished(self, committed):
+        if not committed:
+            self.invalidate()
+        if self.current() is self:
+            on_finish(self)         # still active, so watch the thread's next transaction too
+        
+    def __len__(self):
+        return len(self._nodes) + len(self._rels)
+    
+    def __enter__(self):
+        self._previous = self.current()
+        self._state.map = self
+        on_finish(self)
+        return self
+    def __exit__(self, type, value, traceback):
+        self._state.map = self._previous
+        if self._previous is not None:
+            on_finish(self._previous)
+        self._previous = None
+
+
+def wrap_node(java_node):
+    '''Node wrapper for java_node, from the active IdentityMap if any'''
+    imap = getattr(IdentityMap._state, 'map', None)
+    if imap is None:
+        return Node(java_node)
+    return imap.node(java_node)
+
+def wrap_relationship(java_rel):
+    '''Relationship wrapper for java_rel, from the active IdentityMap if any'''
+    imap = getattr(IdentityMap._state, 'map', None)
+    if imap is None:
+        return Relationship(java_rel)
+    return imap.relationship(java_rel)
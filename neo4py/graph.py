@@ -17,10 +17,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from backend import neo4j
-from util import cached_property
-from core import Node, Relationship, NodeIterator
+import time
+import threading
+from backend import neo4j, attach_thread
+from util import cached_property, set_op_counter, count_ops, retrying, notify_rollback, notify_finish, snapshot_to_dict, ids_to_jarray, entity_id, \
+                 flatten_properties, iter_chunks, iter_ids, id_chunks, jarray_to_py, BULK_CHUNK_SIZE
+from core import Direction, type_names, relationship_types, NodeIterator, IdentityMap, wrap_node, wrap_relationship, IDENTITY_MAP_SIZE
 from index import NodeIndexFactory, RelationshipIndexFactory
+from workers import WorkerPool
+import analytics
 
 __all__ = "GraphDatabase", "Transaction"
 
@@ -29,40 +34,167 @@ class GraphDatabase(object):
         self.__neo__ = neo = neo4j.EmbeddedGraphDatabase(db_path)
         self._nodeshop = NodeShop(neo)
         self._relshop = RelationshipShop(neo)
-        self._current_tx = None
-        self._current_tx_thread = None      #use to determine if more than one thread is being used
-                                            #and if so, store current transaction by thread in a dict
+        self._local = threading.local()     # transaction state is kept per thread, as in Neo4j itself
         self._running = True
         
     def get_tx(self):
-        '''tuple of (tx, created).  created is True if a transaction was not already in progress. If
-        created is True, it is this scopes responsibility to finish() this transaction'''
-        created = False
-        if self._current_tx is not None:
-            if self._current_tx.finished:
-                created = True
-                self._current_tx = Transaction(self.__neo__.beginTx())
-        else:
-            created = True
-            self._current_tx = Transaction(self.__neo__.beginTx())
-        
-        return self._current_tx, created
+        '''tuple of (tx, created) for the calling thread.  created is True if a transaction was not
+        already in progress in this thread. If created is True, it is this scopes responsibility to
+        finish() this transaction'''
+        attach_thread()
+        tx = getattr(self._local, 'tx', None)
+        if tx is None or tx.finished:
+            self._local.tx = tx = Transaction(self.__neo__.beginTx())
+            return tx, True
+        return tx, False
+    
+    @property
+    def current_tx(self):
+        '''Transaction in progress in the calling thread, or None'''
+        tx = getattr(self._local, 'tx', None)
+        if tx is None or tx.finished:
+            return None
+        return tx
     
     def node(self, **kwargs):
+        attach_thread()
         return self._nodeshop.create(**kwargs)
-    
+
+    def create_nodes(self, props, chunk_size=BULK_CHUNK_SIZE):
+        '''Creates a node for each dict in the props iterable and returns the new node ids.
+        Each chunk is created in a single call and committed in its own transaction, unless
+        a transaction is already in progress, in which case the chunks join it'''
+        attach_thread()
+        ids = []
+        for chunk in iter_chunks(props, chunk_size):
+            counts, keys, values = flatten_properties(chunk)
+            ids.extend(self._run_in_tx(neo4j.EntityCreator.createNodes,
+                                       self.__neo__, counts, keys, values)[:])
+            count_ops(len(chunk))
+        return ids
+
+    def create_relationships(self, rels, chunk_size=BULK_CHUNK_SIZE):
+        '''Creates a relationship for each (start, type, end[, props]) tuple in the rels
+        iterable and returns the new relationship ids.  start and end may be nodes or
+        node ids.  Chunks are committed as with create_nodes()'''
+        attach_thread()
+        ids = []
+        for chunk in iter_chunks(rels, chunk_size):
+            starts, types, ends, props = [], [], [], []
+            for rel in chunk:
+                starts.append(entity_id(rel[0]))
+                types.append(getattr(rel[1], 'name', rel[1]))
+                ends.append(entity_id(rel[2]))
+                props.append(rel[3] if len(rel) > 3 else None)
+            counts, keys, values = flatten_properties(props)
+            ids.extend(self._run_in_tx(neo4j.EntityCreator.createRelationships, self.__neo__,
+                                       neo4j.JArray('long')(starts), neo4j.JArray('string')(types),
+                                       neo4j.JArray('long')(ends), counts, keys, values)[:])
+            count_ops(len(chunk))
+        return ids
+
+    def _run_in_tx(self, f, *args, **kwargs):
+        tx, created = self.get_tx()
+        try:
+            retval = f(*args, **kwargs)
+        except:
+            if created:
+                tx.failure()
+            raise
+        finally:
+            if created:
+                tx.finish(True)
+        return retval
+
     @property
-    def nodes(self):        return self._nodeshop
+    def nodes(self):
+        attach_thread()
+        return self._nodeshop
     
     @property
-    def rels(self):         return self._relshop
+    def rels(self):
+        attach_thread()
+        return self._relshop
     
     @property
     def read_only(self):     return self.__neo__.isReadOnly()
     
     @property
-    def reference_node(self):    return Node(self.__neo__.getReferenceNode())
+    def reference_node(self):
+        attach_thread()
+        return wrap_node(self.__neo__.getReferenceNode())
+    
+    def session(self, max_size=IDENTITY_MAP_SIZE):
+        '''IdentityMap which, while active in a with block, returns the same wrapper per
+        node/relationship id in this thread and caches their property values
+        
+            with gdb.session():
+                ...
+        '''
+        return IdentityMap(max_size)
+    
+    def retrying(self, retry_count=3, retry_delay=0.05):
+        '''Transaction attempts which are retried on deadlock, see util.retrying()
+        
+            for attempt in gdb.retrying():
+                with attempt:
+                    ...
+        '''
+        return retrying(self, retry_count, retry_delay)
+    
+    def batch_tx(self, every=None, interval=None):
+        '''Transaction for long running write jobs, which commits and reopens itself
+        every `every` write operations and/or every `interval` milliseconds so its
+        memory use stays bounded.  Use it in a with block, or finish() it.  Note that
+        a failure only rolls back work since the last commit'''
+        if not (every or interval):
+            raise ValueError("Either every or interval must be given")
+        attach_thread()
+        if self.current_tx is not None:
+            raise ValueError("batch_tx cannot be nested in another transaction")
+        self._local.tx = tx = Transaction(self.__neo__.beginTx(), begin=self.__neo__.beginTx,
+                                          every=every, interval=interval)
+        return tx
+    
+    def executor(self, max_workers):
+        '''WorkerPool of threads attached to the JVM, for running read or write jobs
+        on this graph in parallel.  Call shutdown() on it (or use it in a with block)
+        to stop and detach the threads'''
+        return WorkerPool(max_workers, graph=self)
+    
+    
+    def degrees(self, nodes, types=(), direction=Direction.Both):
+        '''Degree of each of a list of nodes or node ids, as Node.degree() but in a
+        single call.  Returns a numpy int32 array if numpy is available, else an
+        array.array('i')'''
+        attach_thread()
+        degrees = neo4j.Degrees.degrees(self.__neo__, ids_to_jarray(nodes), relationship_types(types),
+                                        direction.__jobj__)
+        return jarray_to_py(degrees, '[I')
+    
+    def khop(self, seeds, depth=2, types=(), direction=Direction.Both, max_nodes_per_seed=None, parallel=False):
+        '''Ids of the distinct nodes within depth hops of each of a list of seed nodes
+        (or ids), following relationships of types (all types if empty) in direction.
+        Seeds are expanded breadth first in the JVM, and each one's ids, nearest first
+        and not including the seed, stop at max_nodes_per_seed.  Returns a list of
+        arrays (numpy int64 if available, else 64 bit array.arrays) in the order of seeds.
+        
+        If parallel, seeds are expanded on a shared pool of JVM threads (one per
+        processor).  Those threads only see committed data, not the changes of the
+        calling thread's transaction'''
+        attach_thread()
+        result = neo4j.KHop.expand(self.__neo__, ids_to_jarray(seeds), depth, type_names(types),
+                                   direction.__jobj__, -1 if max_nodes_per_seed is None else max_nodes_per_seed,
+                                   0 if parallel else 1)
+        ids = jarray_to_py(result.getIds(), '[J')
+        offsets = result.getOffsets()[:]
+        return [ids[offsets[i]:offsets[i + 1]] for i in xrange(len(offsets) - 1)]
     
+    def to_csr(self, types=(), direction=Direction.Outgoing, weight=None):
+        '''Topology of the graph as numpy CSR arrays, for neo4py.analytics.  See
+        analytics.to_csr()'''
+        attach_thread()
+        return analytics.to_csr(self.__neo__, types, direction, weight)
     
     def shutdown(self):
         self._running = False;
@@ -75,13 +207,23 @@ class GraphDatabase(object):
     def running(self):      return self._running
     def __nonzero__(self):  return self._running
     
-    @cached_property
+    @property
     def node_indices(self):
-        return NodeIndexFactory(self.__neo__.index())
+        attach_thread()             # on every access, the factory is cached
+        return self._node_indices
     
-    @cached_property
+    @property
     def rel_indices(self):
-        return RelationshipIndexFactory(self.__neo__.index())
+        attach_thread()
+        return self._rel_indices
+    
+    @cached_property
+    def _node_indices(self):
+        return NodeIndexFactory(self.__neo__.index(), self.__neo__)
+    
+    @cached_property
+    def _rel_indices(self):
+        return RelationshipIndexFactory(self.__neo__.index(), self.__neo__)
     
     
 class NodeShop:
@@ -89,48 +231,85 @@ class NodeShop:
         self.__neo__ = java_neo
         
     @cached_property
-    def reference(self):        return Node(self.__neo__.getReferenceNode())
+    def reference(self):        return wrap_node(self.__neo__.getReferenceNode())
     
     def __iter__(self):         return NodeIterator(self.__neo__.getAllNodes())
-    def __getitem__(self,k):    return Node(self.__neo__.getNodeById(k))
+    
+    def ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''Ids of all nodes, read chunk_size at a time without creating Node objects'''
+        return iter_ids(self.__neo__.getAllNodes().iterator(), chunk_size)
+    
+    def id_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        '''Ids of all nodes in arrays of up to chunk_size ids, see util.id_chunks()'''
+        return id_chunks(self.__neo__.getAllNodes().iterator(), chunk_size, format)
+    def __getitem__(self,k):    return wrap_node(self.__neo__.getNodeById(k))
     
     def create(self, **kwargs):
-        node = Node(self.__neo__.createNode())
-        node.update(**kwargs)
+        node = wrap_node(self.__neo__.createNode())
+        count_ops(1 + node._set_properties(kwargs))
         return node
+
+    def snapshot(self, nodes):
+        '''Property dicts for a list of nodes or node ids, read in a single call'''
+        snapshots = neo4j.PropertySnapshot.ofNodes(self.__neo__, ids_to_jarray(nodes))
+        return [snapshot_to_dict(s) for s in snapshots]
     
     
 class RelationshipShop:
     def __init__(self, jgdb):
         self.__neo__ = jgdb
         
-    def __getitem__(self,k):    return Relationship(self.__neo__.getRelationshipById(k))
+    def __getitem__(self,k):    return wrap_relationship(self.__neo__.getRelationshipById(k))
     
     @property
     def types(self):            return self.__neo__.relationshipTypes
 
+    def snapshot(self, rels):
+        '''Property dicts for a list of relationships or relationship ids, read in a single call'''
+        snapshots = neo4j.PropertySnapshot.ofRelationships(self.__neo__, ids_to_jarray(rels))
+        return [snapshot_to_dict(s) for s in snapshots]
+
 
 
 class Transaction:
-    def __init__(self, jtx):
+    '''Neo4j transactions are bound to the thread that began them, so a
+    Transaction may only be used from that thread.
+    
+    If begin is given along with every (operations) and/or interval (milliseconds),
+    the transaction commits and reopens itself through begin() whenever either
+    limit is reached, counting the writes made through neo4py's wrappers'''
+    def __init__(self, jtx, begin=None, every=None, interval=None):
         self.__jtx = jtx
         self._finished = False
         self._marked = False
+        self._failed = False
+        self._thread = threading.current_thread()
+        self._begin = begin
+        self._every = every
+        self._interval = interval / 1000.0 if interval else None
+        self._ops = 0
+        self._started = time.time()
+        if begin is not None and (every or interval):
+            set_op_counter(self)
         
     @property
     def finished(self):
         return self._finished
     
     def success(self):
+        self._check_thread()
         self._marked = True
         self.__jtx.success()
         
     def failure(self):
+        self._check_thread()
         self._marked = True
+        self._failed = True
         self.__jtx.failure()
         
     def finish(self, success=True):
         '''success is ignored if success() or failure() previously called'''
+        self._check_thread()
         if not self._marked:
             if success:
                 self.__jtx.success()
@@ -138,14 +317,58 @@ class Transaction:
                 self.__jtx.failure()
         
         self._finished = True 
-        self.__jtx.finish()
+        if self._begin is not None:
+            set_op_counter(None)
+        try:
+            self.__jtx.finish()
+        except:
+            notify_finish(False)
+            notify_rollback()           # a failed commit rolls back
+            raise
+        rolled_back = self._failed or not (self._marked or success)
+        notify_finish(not rolled_back)
+        if rolled_back:
+            notify_rollback()
+    
+    def count(self, n=1):
+        '''Records n write operations, committing the work so far if a limit is reached'''
+        self._ops += n
+        if ((self._every and self._ops >= self._every) or
+            (self._interval and time.time() - self._started >= self._interval)):
+            self.checkpoint()
+    
+    def checkpoint(self):
+        '''Commits the work so far and continues in a new underlying transaction.  Does
+        nothing once failure() has been called, so the current chunk is rolled back'''
+        self._check_thread()
+        if self._failed or self._finished:
+            return
+        self.__jtx.success()
+        try:
+            self.__jtx.finish()
+        except:
+            self._finished = True
+            if self._begin is not None:
+                set_op_counter(None)
+            notify_finish(False)
+            notify_rollback()
+            raise
+        notify_finish(True)
+        self.__jtx = self._begin()
+        self._marked = False
+        self._ops = 0
+        self._started = time.time()
+        
+    def _check_thread(self):
+        if threading.current_thread() is not self._thread:
+            raise RuntimeError("Transaction belongs to thread [%s]" % (self._thread.name))
         
     def __nonzero__(self):
         return not self._finished
     
     def __enter__(self):
         return self
-    def __exit__(self):
-        self.finish(True)
+    def __exit__(self, type, value, traceback):
+        self.finish(type is None)
             
     
\ No newline at end of file
@@ -17,14 +17,36 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from backend import JTypes
-from core import Node, Relationship
-from util import dict_to_jmap
+import threading
+from backend import neo4j, JTypes
+from core import Node, Relationship, wrap_node, wrap_relationship
+from util import dict_to_jmap, count_ops, cached_property, entity_id, iter_ids, id_chunks, format_chunk, \
+                 iter_chunks, py_to_java, on_rollback, on_delete, on_finish, LRUCache, USE_NUMPY, LONG_TYPECODE, \
+                 ITER_BUFFER_SIZE, BULK_CHUNK_SIZE
+
+INDEX_CACHE_SIZE = 10000
+_ALL = object()         # written (key, value) standing for all of them
+
+
+SCORE = '@score'        # sort key for relevance, best first.  '-' + SCORE for worst first
+
+def _query_context(query, sort, top, trade_correctness_for_speed):
+    '''query wrapped in a lucene QueryContext, if any of the options are given'''
+    if sort is None and top is None and not trade_correctness_for_speed:
+        return query
+    if not isinstance(query, (basestring, neo4j.Object)) or neo4j.QueryContext.instance_(query):
+        raise TypeError("sort, top and trade_correctness_for_speed need a query string or lucene Query, "
+                        "not %r" % (query,))
+    if isinstance(sort, basestring):
+        sort = (sort,)
+    return neo4j.Queries.context(query, neo4j.JArray('string')(sort or ()), top or 0,
+                                 trade_correctness_for_speed)
 
 
 class _IndexFactory(object):
-    def __init__(self, java_index_manager):
+    def __init__(self, java_index_manager, java_graph=None):
         self.__imanager__ = java_index_manager
+        self.__neo__ = java_graph
         self._item_constructor = None       #Override
         self._item_type = None
     
@@ -75,9 +97,9 @@ class _IndexFactory(object):
         
         
 class NodeIndexFactory(_IndexFactory):
-    def __init__(self, java_index_manager):
-        super(NodeIndexFactory, self).__init__(java_index_manager)
-        self._item_constructor = Node
+    def __init__(self, java_index_manager, java_graph=None):
+        super(NodeIndexFactory, self).__init__(java_index_manager, java_graph)
+        self._item_constructor = wrap_node
         self._item_type = Node
     
     def _exists(self, name):
@@ -87,17 +109,17 @@ class NodeIndexFactory(_IndexFactory):
         return self.__imanager__.nodeIndexNames()
     
     def _get(self, name):
-        return NodeIndex(self.__imanager__.forNodes(name))
+        return NodeIndex(self.__imanager__.forNodes(name), self.__neo__)
     
     def _make(self, name, params):
-        return NodeIndex(self.__imanager__.forNodes(name, params))
+        return NodeIndex(self.__imanager__.forNodes(name, params), self.__neo__)
     
         
     
 class RelationshipIndexFactory(_IndexFactory):
-    def __init__(self, java_index_manager):
-        super(RelationshipIndexFactory, self).__init__(java_index_manager)
-        self._item_constructor = Relationship
+    def __init__(self, java_index_manager, java_graph=None):
+        super(RelationshipIndexFactory, self).__init__(java_index_manager, java_graph)
+        self._item_constructor = wrap_relationship
         self._item_type = Relationship
     
     def _exists(self, name):
@@ -107,15 +129,22 @@ class RelationshipIndexFactory(_IndexFactory):
         return self.__imanager__.relationshipIndexNames()
     
     def _get(self, name):
-        return RelationshipIndex(self.__imanager__.forRelationships(name))
+        return RelationshipIndex(self.__imanager__.forRelationships(name), self.__neo__)
     
     def _make(self, name, params):
-        return RelationshipIndex(self.__imanager__.forRelationships(name, params))
+        return RelationshipIndex(self.__imanager__.forRelationships(name, params), self.__neo__)
     
 
 class _Index(object):
-    def __init__(self, java_index):
+    def __init__(self, java_index, java_graph=None):
         self.__jobj__ = java_index
+        self.__neo__ = java_graph       # needed to look up ids in add_many()/remove_many()
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._generation = 0            # bumped by every invalidation
+        self._written = threading.local()
+        self.cache_hits = 0
+        self.cache_misses = 0
     
     @property
     def name(self):
@@ -128,6 +157,8 @@ class _Index(object):
     def __setitem__(self, (key, value), entity):
         self._verify_entity_type(entity)
         self.__jobj__.add(entity.__jobj__, key, value)
+        self._write(key, value)
+        count_ops()
         
     def __delitem__(self, args):
         if not isinstance(args, tuple):
@@ -139,6 +170,55 @@ class _Index(object):
            
         self._verify_entity_type(entity)
         self.__jobj__.remove(entity.__jobj__, *args)
+        self._write(*args)
+        count_ops()
+        
+    def add_many(self, entries, chunk_size=BULK_CHUNK_SIZE):
+        '''Adds each (entity, key, value) of the entries iterable, entity being a
+        node/relationship or its id.  Entries are sent chunk_size at a time, each chunk
+        in a single call.  Must be within a transaction.  If an id doesn't exist its
+        chunk fails (NotFoundException) before changing the index, but earlier chunks
+        remain applied in the transaction'''
+        self._bulk(self._add_entries, entries, chunk_size)
+    
+    def remove_many(self, entries, chunk_size=BULK_CHUNK_SIZE):
+        '''Removes each (entity, key, value) of the entries iterable, as add_many() adds them'''
+        self._bulk(self._remove_entries, entries, chunk_size)
+    
+    def get_many(self, key, values, chunk_size=BULK_CHUNK_SIZE):
+        '''Exact lookup of each of values under key, chunk_size values per call.  Returns
+        a dict of value => list of ids of the entities indexed under it'''
+        if self._cache is None:
+            return self._get_many(key, set(values), chunk_size)
+        found = self._cached_many(key, set(values), chunk_size)
+        return dict((value, list(ids)) for value, ids in found.iteritems())
+    
+    def _get_many(self, key, values, chunk_size):
+        result = {}
+        for chunk in iter_chunks(values, chunk_size):
+            jvalues = neo4j.JArray('object')([py_to_java(v) for v in chunk])
+            lookup = neo4j.IndexLookup.get(self.__jobj__, key, jvalues)
+            ids = lookup.getIds()[:]
+            offsets = lookup.getOffsets()[:]
+            for i, value in enumerate(chunk):
+                result[value] = ids[offsets[i]:offsets[i + 1]]
+        return result
+    
+    def _bulk(self, f, entries, chunk_size):
+        if self.__neo__ is None:
+            raise ValueError("Index [%s] has no graph to look up entities in" % (self.name))
+        for chunk in iter_chunks(entries, chunk_size):
+            ids, keys, values = [], [], []
+            for entity, key, value in chunk:
+                if not isinstance(entity, (int, long)):
+                    self._verify_entity_type(entity)
+                ids.append(entity_id(entity))
+                keys.append(key)
+                values.append(py_to_java(value))
+                self._write(key, value)
+            f(self.__neo__, self.__jobj__, neo4j.JArray('long')(ids), neo4j.JArray('string')(keys),
+              neo4j.JArray('object')(values))
+            count_ops(len(chunk))
         
     def _verify_entity_type(self, entity):
         if not isinstance(entity, self.entity_type):
@@ -146,29 +226,136 @@ class _Index(object):
         
     def delete(self):
         self.__jobj__.delete()
+        self._write()
+        
+    def enable_cache(self, max_size=INDEX_CACHE_SIZE):
+        '''Caches the ids found by exact get()/get_many() lookups, for up to max_size
+        (key, value)s, least recently used dropped first.  The cache only holds committed
+        results: (key, value)s written through this index object are looked up directly
+        by the writing thread, and dropped from the cache when its transaction commits.
+        Rollbacks and node/relationship deletions clear the cache.  Changes made through
+        other index objects are not seen.  cache_hits and cache_misses count the
+        lookups.  Returns self'''
+        with self._cache_lock:
+            self._cache = LRUCache(max_size)
+            self.cache_hits = self.cache_misses = 0
+        on_rollback(self)
+        on_delete(self)
+        return self
+    
+    def disable_cache(self):
+        self._cache = None
+    
+    def invalidate(self):
+        '''Empties the lookup cache, if enabled'''
+        with self._cache_lock:
+            self._generation += 1
+            if self._cache is not None:
+                self._cache.clear()
+    
+    def _invalidate(self, keys):
+        with self._cache_lock:
+            self._generation += 1
+            if self._cache is not None:
+                for k in keys:
+                    self._cache.pop(k)
+    
+    def _write(self, key=None, value=None):
+        '''Records that the calling thread's transaction changed (key, value), or every
+        value of key / every key if value / key is None'''
+        if self._cache is None:
+            return
+        written = getattr(self._written, 'keys', None)
+        if written is None:
+            written = self._written.keys = set()
+            on_finish(self)
+        if value is None:
+            written.add(_ALL)
+            self.invalidate()
+        else:
+            written.add((key, value))
+            self._invalidate([(key, value)])
+    
+    def tx_finished(self, committed):
+        written = getattr(self._written, 'keys', None)
+        self._written.keys = None
+        if not committed or not written:
+            return                      # rollbacks clear the cache through invalidate()
+        if _ALL in written:
+            self.invalidate()
+        else:
+            self._invalidate(written)
+    
+    def _uncommitted(self, key, value):
+        '''Whether the calling thread's transaction changed (key, value)'''
+        written = getattr(self._written, 'keys', None)
+        return bool(written) and (_ALL in written or (key, value) in written)
+    
+    def _cached_many(self, key, values, chunk_size):
+        '''value => tuple of ids for each of values, from the cache where possible'''
+        result, missing = {}, []
+        with self._cache_lock:
+            for value in values:
+                ids = None
+                if not self._uncommitted(key, value):
+                    ids = self._cache.get((key, value))
+                if ids is None:
+                    self.cache_misses += 1
+                    missing.append(value)
+                else:
+                    self.cache_hits += 1
+                    result[value] = ids
+            generation = self._generation
+        if missing:
+            found = self._get_many(key, missing, chunk_size)
+            with self._cache_lock:
+                store = self._generation == generation and self._cache is not None
+                for value in missing:
+                    ids = result[value] = tuple(found[value])
+                    if store and not self._uncommitted(key, value):
+                        self._cache[key, value] = ids
+        return result
+    
+    def _get(self, key, value):
+        '''Hits for an exact lookup, from the cache if enabled'''
+        if self._cache is None:
+            return self._hits(self.__jobj__.get(key, value))
+        ids = self._cached_many(key, (value,), 1)[value]
+        return self._hits(self._hits_by_id(self.__neo__, neo4j.JArray('long')(ids)))
+        
+    def _hits(self, java_indexhits):
+        return IndexHits(java_indexhits, self._item_constructor, self._next_items, cast=self._cast)
 
 
 
 class NodeIndex(_Index):
-    def __init__(self, java_index):
-        super(NodeIndex, self).__init__(java_index)
-        self._item_constructor = Node
+    def __init__(self, java_index, java_graph=None):
+        super(NodeIndex, self).__init__(java_index, java_graph)
+        self._item_constructor = wrap_node
+        self._next_items = neo4j.Buffers.nextNodes
+        self._cast = neo4j.Node.cast_
+        self._add_entries = neo4j.Indexing.addNodes
+        self._remove_entries = neo4j.Indexing.removeNodes
+        self._hits_by_id = neo4j.IdHits.nodes
     
     def simple_query(self, key, value):
         hits = self.__jobj__.query(key, value)
-        return IndexHits(hits, self._item_constructor)
+        return self._hits(hits)
     
-    def query(self, query):
+    def query(self, query, sort=None, top=None, trade_correctness_for_speed=False):
+        '''Lucene query.  Hits are sorted by the sort key(s), or SCORE for relevance
+        (prefix a key with '-' to reverse it).  Values are sorted as strings.  If top is
+        given only that many of the best hits are collected.  trade_correctness_for_speed
+        skips merging in changes of the current transaction'''
         try:
-            hits = self.__jobj__.query(query)
+            hits = self.__jobj__.query(_query_context(query, sort, top, trade_correctness_for_speed))
         except JTypes.JavaError, ex:                                ##TODO better ex type
             raise ValueError("A JavaError occured while querying.  Make sure query syntax is correct. Error:\n\n" + str(ex))
             
-        return IndexHits(hits, self._item_constructor)
+        return self._hits(hits)
     
     def get(self, key, value):
-        hits = self.__jobj__.get(key, value)
-        return IndexHits(hits, self._item_constructor)
+        return self._get(key, value)
     
     def __getitem__(self, (key, value)):
         return self.get(key, value)
@@ -178,25 +365,35 @@ class NodeIndex(_Index):
         return Node
 
 class RelationshipIndex(_Index):
-    def __init__(self, java_index):
-        super(RelationshipIndex, self).__init__(java_index)
-        self._item_constructor = Relationship
+    def __init__(self, java_index, java_graph=None):
+        super(RelationshipIndex, self).__init__(java_index, java_graph)
+        self._item_constructor = wrap_relationship
+        self._next_items = neo4j.Buffers.nextRelationships
+        self._cast = neo4j.Relationship.cast_
+        self._add_entries = neo4j.Indexing.addRelationships
+        self._remove_entries = neo4j.Indexing.removeRelationships
+        self._hits_by_id = neo4j.IdHits.relationships
         
     def simple_query(self, key, value, start_node=None, end_node=None):
         hits = self.__jobj__.query(key, value, start_node, end_node)
-        return IndexHits(hits, self._item_constructor)
+        return self._hits(hits)
     
-    def query(self, query, start_node=None, end_node=None):
+    def query(self, query, start_node=None, end_node=None, sort=None, top=None,
+              trade_correctness_for_speed=False):
+        '''See NodeIndex.query()'''
         try:
-            hits = self.__jobj__.query(query, start_node, end_node)
+            hits = self.__jobj__.query(_query_context(query, sort, top, trade_correctness_for_speed),
+                                       start_node, end_node)
         except JTypes.JavaError, ex:                                ##TODO better ex type
             raise ValueError("A JavaError occured while querying.  Make sure query syntax is correct. Error:\n\n" + str(ex))
             
-        return IndexHits(hits, self._item_constructor)
+        return self._hits(hits)
     
     def get(self, key, value, start_node=None, end_node=None):
+        if start_node is None and end_node is None:
+            return self._get(key, value)
         hits = self.__jobj__.get(key, value, start_node, end_node)
-        return IndexHits(hits, self._item_constructor)
+        return self._hits(hits)
     
     def __getitem__(self, (key, value)):
         return self.get(key, value, None, None)
@@ -207,37 +404,172 @@ class RelationshipIndex(_Index):
 
 
 class IndexHits(object):
-    '''User must close this if not using all items (attempts to close itself when garbage collected)'''
-    def __init__(self, java_indexhits, item_constructor):
+    '''Hits of an index lookup or query.  Hits can only be iterated once, and are
+    closed when fully iterated.  Otherwise the user must close them, or use them in
+    a with block (they attempt to close themselves when garbage collected)
+    
+    Slicing, eg. hits[100:200], returns the hits from offset 100 up to 200, without
+    creating objects for the ones skipped.  Slices share the underlying iterator, so
+    they must be read in increasing order without overlapping (eg. hits[0:20] then
+    hits[20:40]), else ValueError is raised.  Reading a slice to its end closes the
+    hits only if no hits remain.  Items are read from the JVM buffer_size at a time'''
+    def __init__(self, java_indexhits, item_constructor, next_items, offset=0, limit=None,
+                 buffer_size=ITER_BUFFER_SIZE, parent=None, cast=None):
         self.__jobj__ = java_indexhits
         self._constructor = item_constructor
-        self.__single = None
+        self._next_items = next_items
+        self._cast = cast               # java PropertyContainer => Node/Relationship
+        self._offset = offset
+        self._limit = limit
+        self.buffer_size = buffer_size
+        self._parent = parent           # slices keep the hits they were taken from alive
+        self._size = None
+        self._closed = False
+        self._position = 0              # hits read from the java iterator, on the root
         
-    @property
+    @cached_property
     def single(self):
         '''Assumes user will ignore remaining hits and closes iterator'''
         jentity = self.__jobj__.getSingle()
         entity = self._constructor(jentity) if jentity else None
-        self.__dict__['single'] = entity
         self.close()
         return entity
    
+    @property
+    def _root(self):
+        return self if self._parent is None else self._parent
+    
     def __len__(self):
-        return self.__jobj__.size()
+        root = self._root
+        if root._size is None:
+            root._size = self.__jobj__.size()
+        size = max(0, root._size - self._offset)
+        if self._limit is not None:
+            size = min(size, self._limit)
+        return size
+    
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            for item in self[k:k + 1]:
+                return item
+            raise IndexError(k)
+        if k.step not in (None, 1) or (k.start or 0) < 0 or (k.stop is not None and k.stop < 0):
+            raise ValueError("Only slices with non negative start and stop are supported")
+        start = k.start or 0
+        limit = None if k.stop is None else max(0, k.stop - start)
+        if self._limit is not None:
+            limit = max(0, min(self._limit - start, self._limit if limit is None else limit))
+        return IndexHits(self.__jobj__, self._constructor, self._next_items, self._offset + start, limit,
+                         self.buffer_size, self._root, self._cast)
+    
+    def _skip_offset(self):
+        '''Skips to this slice's offset from where the hits were last read'''
+        root = self._root
+        skip = self._offset - root._position
+        if skip < 0:
+            raise ValueError("Hits up to %d were already read, can't read from %d.  Slices must be read "
+                             "in increasing order without overlapping" % (root._position, self._offset))
+        if skip:
+            root._position += neo4j.Buffers.skip(self.__jobj__, skip)
+    
+    def _read(self, count):
+        self._root._position += count
+    
+    def _done(self, exhausted):
+        '''Closes the hits if no hits remain, or the root hits were read'''
+        if exhausted or self._parent is None:
+            self.close()
     
     def __iter__(self):
-        for item in self.__jobj__:
-            yield self._constructor(item)
+        self._skip_offset()
+        remaining = self._limit
+        exhausted = False
+        while remaining is None or remaining > 0:
+            size = self.buffer_size if remaining is None else min(self.buffer_size, remaining)
+            buffer = self._next_items(self.__jobj__, size)
+            self._read(len(buffer))
+            for item in buffer:
+                yield self._constructor(item)
+            if remaining is not None:
+                remaining -= len(buffer)
+            if len(buffer) < size:
+                exhausted = True
+                break
+        self._done(exhausted)
+    
+    def ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''Ids of the hits, read chunk_size at a time without creating entity objects.
+        Closes the hits when done'''
+        for chunk in self.id_chunks(chunk_size, 'list'):
+            for id in chunk:
+                yield id
+    
+    def id_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        '''Ids of the hits in arrays, see util.id_chunks().  Closes the hits when done'''
+        self._skip_offset()
+        read = 0
+        try:
+            for chunk in id_chunks(self.__jobj__, chunk_size, format, self._limit):
+                self._read(len(chunk))
+                read += len(chunk)
+                yield chunk
+        finally:
+            self._done(self._limit is None or read < self._limit)
             
     def __del__(self):
-        self.close()
+        if self._parent is None:
+            self.close()
      
+    def _scored_batches(self, chunk_size, with_items):
+        self._skip_offset()
+        remaining = self._limit
+        exhausted = False
+        try:
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                batch = neo4j.ScoredBatch.next(self.__jobj__, size, with_items)
+                count = batch.size()
+                self._read(count)
+                if count:
+                    yield batch
+                if remaining is not None:
+                    remaining -= count
+                if count < size:
+                    exhausted = True
+                    break
+        finally:
+            self._done(exhausted or remaining is None)
+    
     def withscore(self):
-        hits = self.__jobj__
-        for item in hits:
-            yield self._constructor(item), hits.currentScore()
+        '''(entity, score) of each hit, read buffer_size hits (and their scores) per call'''
+        cast = self._cast
+        for batch in self._scored_batches(self.buffer_size, True):
+            for item, score in zip(batch.getItems(), batch.getScores()[:]):
+                yield self._constructor(cast(item)), score
+    
+    def scored_ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''(id, score) of each hit, without creating entity objects'''
+        for ids, scores in self.score_chunks(chunk_size, 'list'):
+            for pair in zip(ids, scores):
+                yield pair
+    
+    def score_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        '''(ids, scores) array pairs of up to chunk_size hits each, formatted as by
+        id_chunks() (scores are float32).  Closes the hits when done'''
+        if format is None:
+            format = 'numpy' if USE_NUMPY else 'array'
+        for batch in self._scored_batches(chunk_size, False):
+            yield (format_chunk(batch.getIds()[:], format, LONG_TYPECODE, 'int64'),
+                   format_chunk(batch.getScores()[:], format, 'f', 'float32'))
             
     def close(self):
-        self.__jobj__.close()
+        root = self._root
+        if not root._closed:
+            len(root)                   # size stays available once closed
+            root._closed = True
+            self.__jobj__.close()
         
-    
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        self.close()
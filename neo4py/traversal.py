@@ -19,8 +19,9 @@
 
 from itertools import chain
 from backend import neo4j, JTypes
-from util import cached_property
-from core import Node, Relationship, Direction
+from util import cached_property, py_to_java, values_to_jarray, BufferedIterator, iter_ids, id_chunks, \
+                 ITER_BUFFER_SIZE, BULK_CHUNK_SIZE
+from core import Direction, wrap_node, wrap_relationship
 
 class Order:
     DEPTH_FIRST = neo4j.Traverser.Order.DEPTH_FIRST
@@ -35,6 +36,107 @@ class Returnable:
     ALL_BUT_START_NODE = neo4j.ReturnableEvaluator.ALL_BUT_START_NODE
 
 
+class Predicate(object):
+    '''Condition on a traversal position which is evaluated in the JVM, so is much
+    faster than a python is_stop/is_returnable function.  Predicates combine with
+    & (and), | (or) and ~ (not):
+    
+        is_returnable = LastRelationshipType('IS_A') & ~PropertyEquals('extinct', True)
+    
+    Predicate itself is abstract.  Subclasses define _compile(), returning a new
+    org.neo4py.PositionPredicate (see org.neo4py.Predicates)
+    '''
+    _jobj = None
+    stop_only = False           # true if only meaningful as is_stop or prune()
+    
+    def compile(self):
+        '''The org.neo4py.PositionPredicate for this predicate'''
+        if self._jobj is None:
+            self._jobj = self._compile()
+        return self._jobj
+    
+    def _compile(self):
+        raise NotImplementedError("%s must define _compile()" % type(self).__name__)
+    
+    def _compile_filter(self):
+        '''compile() for use as is_returnable or filter()'''
+        if self.stop_only:
+            raise TypeError("MaxDepth is true from a depth on, so can only be used as is_stop or prune(), "
+                            "not in %r; use Depth(max=...) to return positions up to a depth" % self)
+        return self.compile()
+    
+    def __and__(self, other):   return And(self, other)
+    def __or__(self, other):    return Or(self, other)
+    def __invert__(self):       return Not(self)
+
+
+class Depth(Predicate):
+    '''True if min <= depth <= max (the start node is at depth 0)'''
+    def __init__(self, min=0, max=None):
+        self.min, self.max = min, max
+    def _compile(self):
+        return neo4j.Predicates.depth(self.min, -1 if self.max is None else self.max)
+
+class MaxDepth(Depth):
+    '''True from depth on, so as is_stop or prune() nodes deeper than depth are not
+    visited.  It can't be used as is_returnable or filter(), where it would return
+    the nodes at depth and beyond'''
+    stop_only = True
+    def __init__(self, depth):
+        super(MaxDepth, self).__init__(min=depth)
+    def __repr__(self):
+        return 'MaxDepth(%r)' % self.min
+
+class PropertyEquals(Predicate):
+    def __init__(self, key, value):
+        self.key, self.value = key, value
+    def _compile(self):
+        return neo4j.Predicates.propertyEquals(self.key, py_to_java(self.value))
+
+class PropertyIn(Predicate):
+    def __init__(self, key, values):
+        self.key, self.values = key, list(values)
+    def _compile(self):
+        return neo4j.Predicates.propertyIn(self.key, values_to_jarray(self.values))
+
+class PropertyRange(Predicate):
+    '''True if low <= value <= high.  Either bound may be None'''
+    def __init__(self, key, low=None, high=None):
+        self.key, self.low, self.high = key, low, high
+    def _compile(self):
+        return neo4j.Predicates.propertyRange(self.key,
+                    None if self.low is None else py_to_java(self.low),
+                    None if self.high is None else py_to_java(self.high))
+
+class LastRelationshipType(Predicate):
+    '''True if the relationship last traversed has one of types (False at the start node)'''
+    def __init__(self, *types):
+        self.types = [getattr(t, 'name', t) for t in types]
+    def _compile(self):
+        return neo4j.Predicates.lastRelationshipType(neo4j.JArray('string')(self.types))
+
+class And(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = predicates
+    @property
+    def stop_only(self):
+        return any(p.stop_only for p in self.predicates)
+    def _compile(self):
+        return neo4j.Predicates.allOf(neo4j.JArray('object')(
+                    [p.compile() for p in self.predicates], neo4j.PositionPredicate))
+
+class Or(And):
+    def _compile(self):
+        return neo4j.Predicates.anyOf(neo4j.JArray('object')(
+                    [p.compile() for p in self.predicates], neo4j.PositionPredicate))
+
+class Not(Predicate):
+    def __init__(self, predicate):
+        self.predicate = predicate
+    def _compile(self):
+        return neo4j.Predicates.negate(self.predicate.compile())
+
+
 class Traverser(object):
     order = Order.BREADTH_FIRST
     types = []
@@ -46,26 +148,30 @@ class Traverser(object):
             neo4j.NativeStopEvaluator.__init__(self)
             self.__method = method
         def isStopNode(self, pos):
-            self.__method(TraversalPosition(pos))
+            return bool(self.__method(TraversalPosition(pos)))
     
     class DynamicReturnableEvaluator(neo4j.NativeReturnableEvaluator):
         def __init__(self, method):
             neo4j.NativeReturnableEvaluator.__init__(self)
             self.__method = method
-        def isStopNode(self, pos):
-            self.__method(TraversalPosition(pos))
+        def isReturnableNode(self, pos):
+            return bool(self.__method(TraversalPosition(pos)))
     
     def __init__(self, node):
         self.__jobj__ = node.__jobj__.traverse(*self.as_arg_list())
     
     
     def as_arg_list(self):
-        if neo4j.ReturnableEvaluator.instance_(self.is_returnable):
+        if isinstance(self.is_returnable, Predicate):
+            ret_eval = neo4j.PredicateReturnableEvaluator(self.is_returnable._compile_filter())
+        elif neo4j.ReturnableEvaluator.instance_(self.is_returnable):
             ret_eval = self.is_returnable
         else:
             ret_eval = self.DynamicReturnableEvaluator(self.is_returnable)
             
-        if neo4j.StopEvaluator.instance_(self.is_stop):
+        if isinstance(self.is_stop, Predicate):
+            stop_eval = neo4j.PredicateStopEvaluator(self.is_stop.compile())
+        elif neo4j.StopEvaluator.instance_(self.is_stop):
             stop_eval = self.is_stop
         else:
             stop_eval = self.DynamicStopEvaluator(self.is_stop)
@@ -82,11 +188,19 @@ class Traverser(object):
     
     @cached_property
     def all_nodes(self):
-        return [Node(JTypes.Node.cast_(jnode)) for jnode in self.__jobj__.getAllNodes()]
+        return [wrap_node(JTypes.Node.cast_(jnode)) for jnode in self.__jobj__.getAllNodes()]
     
     def __iter__(self):
         for jnode in iter(self.__jobj__):
-            yield Node(JTypes.Node.cast_(jnode))        #not sure why these need to be casted, but they do
+            yield wrap_node(JTypes.Node.cast_(jnode))        #not sure why these need to be casted, but they do
+    
+    def ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''Ids of the nodes traversed to, read chunk_size at a time without creating Node objects'''
+        return iter_ids(self.__jobj__.iterator(), chunk_size)
+    
+    def id_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        '''Ids of the nodes traversed to in arrays, see util.id_chunks()'''
+        return id_chunks(self.__jobj__.iterator(), chunk_size, format)
             
 
 #def create_traverser(types, order=None, stop_evaluator=None, return_evaluator=None):
@@ -105,12 +219,15 @@ class Traverser(object):
 
 
 class TraversalPosition(object):
+    __slots__ = '__jobj__', '_cached_node', '_cached_depth', '_cached_num_returned', '_cached_is_start', \
+                '_cached_last_relationship', '_cached_previous_node'
+    
     def __init__(self, java_pos):
         self.__jobj__ = java_pos
         
     @cached_property
     def node(self):
-        return Node(self.__jobj__.currentNode())
+        return wrap_node(self.__jobj__.currentNode())
     
     @cached_property
     def depth(self):
@@ -126,10 +243,192 @@ class TraversalPosition(object):
     @cached_property
     def last_relationship(self):
         if self.is_start: return None
-        return Relationship(self.__jobj__.lastRelationshipTraversed())
+        return wrap_relationship(self.__jobj__.lastRelationshipTraversed())
     
     @cached_property
     def previous_node(self):
-        return Node(self.__jobj__.previousNode())
+        return wrap_node(self.__jobj__.previousNode())
+    
+    
+
+class Uniqueness:
+    NONE = neo4j.Uniqueness.NONE
+    NODE_GLOBAL = neo4j.Uniqueness.NODE_GLOBAL
+    NODE_PATH = neo4j.Uniqueness.NODE_PATH
+    NODE_RECENT = neo4j.Uniqueness.NODE_RECENT
+    RELATIONSHIP_GLOBAL = neo4j.Uniqueness.RELATIONSHIP_GLOBAL
+    RELATIONSHIP_PATH = neo4j.Uniqueness.RELATIONSHIP_PATH
+    RELATIONSHIP_RECENT = neo4j.Uniqueness.RELATIONSHIP_RECENT
+
+
+class TraversalDescription(object):
+    '''Builder over Neo4j's traversal framework (org.neo4j.kernel.Traversal).  Like the
+    java TraversalDescription, it is immutable: each method returns a new description,
+    so partial descriptions can be shared.
+    
+        friends = TraversalDescription().expand(Direction.Both.Knows) \
+                      .uniqueness(Uniqueness.NODE_GLOBAL).prune(MaxDepth(2)).filter(Depth(min=1))
+        for path in friends.traverse(node):
+            print path.end_id
+    
+    prune() and filter() take Predicates (or java PruneEvaluator / Predicate<Path> objects),
+    so a traversal runs without calling back into python'''
+    def __init__(self, java_description=None):
+        if java_description is None:
+            java_description = neo4j.Traversal.description()
+        self.__jobj__ = java_description
+        
+    def expand(self, *types):
+        '''Follow only relationships of types (Direction.X.TYPE, or names to follow
+        in both directions), replacing any previous expand()/relationships().  A java
+        RelationshipExpander may be given instead'''
+        return TraversalDescription(self.__jobj__.expand(expander(*types)))
+    
+    def relationships(self, *types):
+        '''Adds types to the relationships followed'''
+        jdesc = self.__jobj__
+        for t in types:
+            jdesc = jdesc.relationships(*_type_and_direction(t))
+        return TraversalDescription(jdesc)
+    
+    def prune(self, predicate):
+        '''Paths are not expanded past positions matching predicate'''
+        if isinstance(predicate, Predicate):
+            predicate = neo4j.PredicatePruneEvaluator(predicate.compile())
+        return TraversalDescription(self.__jobj__.prune(predicate))
+    
+    def max_depth(self, depth):
+        return TraversalDescription(self.__jobj__.prune(neo4j.Traversal.pruneAfterDepth(depth)))
+    
+    def filter(self, predicate):
+        '''Only paths ending at positions matching predicate are returned'''
+        if isinstance(predicate, Predicate):
+            predicate = neo4j.PredicatePathFilter(predicate._compile_filter())
+        return TraversalDescription(self.__jobj__.filter(predicate))
     
-    
\ No newline at end of file
+    def uniqueness(self, uniqueness, param=None):
+        '''One of the Uniqueness constants.  param is the cache size for the *_RECENT ones'''
+        if param is None:
+            return TraversalDescription(self.__jobj__.uniqueness(uniqueness))
+        return TraversalDescription(self.__jobj__.uniqueness(uniqueness, param))
+    
+    def depth_first(self):
+        return TraversalDescription(self.__jobj__.depthFirst())
+    
+    def breadth_first(self):
+        return TraversalDescription(self.__jobj__.breadthFirst())
+    
+    def traverse(self, node):
+        jnode = getattr(node, '__jobj__', node)
+        return PathTraverser(self.__jobj__.traverse(jnode), jnode.getGraphDatabase())
+
+
+def expander(*types):
+    '''java RelationshipExpander following relationships of types (Direction.X.TYPE, or
+    names to follow in both directions), or all relationships if no types are given.
+    A single java RelationshipExpander is returned as is'''
+    if len(types) == 1 and neo4j.RelationshipExpander.instance_(types[0]):
+        return types[0]
+    if not types:
+        return neo4j.Traversal.expanderForAllTypes(neo4j.Direction.BOTH)
+    jexpander = neo4j.Traversal.emptyExpander()
+    for t in types:
+        jexpander = jexpander.add(*_type_and_direction(t))
+    return jexpander
+
+def _type_and_direction(rt):
+    if not hasattr(rt, 'direction'):
+        rt = Direction.Both(getattr(rt, 'name', rt))
+    return rt.__jobj__, rt.direction.__jobj__
+
+
+class PathTraverser(object):
+    '''Result of TraversalDescription.traverse().  Iterating yields Paths, whose ids are
+    read from the JVM buffer_size paths at a time.  Like any java traverser, it can
+    only be iterated once'''
+    def __init__(self, java_traverser, java_gdb, buffer_size=ITER_BUFFER_SIZE):
+        self.__jobj__ = java_traverser
+        self.__neo__ = java_gdb
+        self.buffer_size = buffer_size
+        
+    def __iter__(self):
+        return iter_paths(self.__jobj__.iterator(), self.__neo__, self.buffer_size)
+    
+    def ids(self, chunk_size=BULK_CHUNK_SIZE):
+        '''Ids of the end nodes of the paths'''
+        return iter_ids(self.__jobj__.nodes().iterator(), chunk_size)
+    
+    def id_chunks(self, chunk_size=BULK_CHUNK_SIZE, format=None):
+        return id_chunks(self.__jobj__.nodes().iterator(), chunk_size, format)
+    
+    def nodes(self):
+        '''End nodes of the paths'''
+        return BufferedIterator(self.__jobj__.nodes().iterator(), self.buffer_size,
+                                lambda jnode: wrap_node(JTypes.Node.cast_(jnode)))
+    
+    def relationships(self):
+        '''Last relationships of the paths (the start node's empty path has none)'''
+        return BufferedIterator(self.__jobj__.relationships().iterator(), self.buffer_size,
+                                lambda jrel: wrap_relationship(neo4j.Relationship.cast_(jrel)))
+
+
+class Path(object):
+    '''Ids of the nodes and relationships along a path, from its start node.  Node
+    and Relationship objects are only created when nodes/relationships are read'''
+    __slots__ = '__neo__', 'node_ids', 'relationship_ids'
+    
+    def __init__(self, java_gdb, node_ids, relationship_ids):
+        self.__neo__ = java_gdb
+        self.node_ids = node_ids
+        self.relationship_ids = relationship_ids
+        
+    @property
+    def start_id(self):     return self.node_ids[0]
+    @property
+    def end_id(self):       return self.node_ids[-1]
+    
+    @property
+    def start(self):        return wrap_node(self.__neo__.getNodeById(self.start_id))
+    @property
+    def end(self):          return wrap_node(self.__neo__.getNodeById(self.end_id))
+    
+    @property
+    def nodes(self):
+        return [wrap_node(self.__neo__.getNodeById(id)) for id in self.node_ids]
+    
+    @property
+    def relationships(self):
+        return [wrap_relationship(self.__neo__.getRelationshipById(id)) for id in self.relationship_ids]
+    
+    def __len__(self):
+        return len(self.relationship_ids)
+    
+    def __nonzero__(self):
+        return True
+    
+    def __str__(self):
+        return "Path(%s)" % ' -> '.join(str(id) for id in self.node_ids)
+
+
+def iter_paths(java_path_iter, java_gdb, buffer_size=ITER_BUFFER_SIZE):
+    '''Paths for a java iterator of org.neo4j.graphdb.Path, copied buffer_size at a time'''
+    while True:
+        batch = neo4j.PathBatch.next(java_path_iter, buffer_size)
+        for path in _batch_paths(batch, java_gdb):
+            yield path
+        if batch.size() < buffer_size:
+            break
+
+def to_path(java_path, java_gdb, cls=Path):
+    return _batch_paths(neo4j.PathBatch.of(java_path), java_gdb, cls)[0]
+
+def _batch_paths(batch, java_gdb, cls=Path):
+    node_ids = batch.getNodeIds()[:]
+    rel_ids = batch.getRelationshipIds()[:]
+    paths = []
+    n = r = 0
+    for length in batch.getLengths()[:]:
+        paths.append(cls(java_gdb, node_ids[n:n + length + 1], rel_ids[r:r + length]))
+        n += length + 1
+        r += length
+    return paths
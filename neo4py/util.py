@@ -17,47 +17,209 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from __future__ import with_statement
 import sys
+import time
+import array
+import random
+import weakref
+import functools
 import itertools
+import threading
 from backend import neo4j as java
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 ITER_BUFFER_SIZE = 100
+BULK_CHUNK_SIZE = 10000
+
+USE_NUMPY = numpy is not None       # convert primitive array properties to numpy arrays when available
+
+def _long_typecode():
+    # 'l' is only 32 bits on Windows, and 'q' needs python 3.3
+    for typecode in ('l', 'q'):
+        try:
+            if array.array(typecode).itemsize >= 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+LONG_TYPECODE = _long_typecode()    # array.array typecode for java longs (ids), None if there is none
 
 
 VALUE_METHOD_MAPPING = (
     (java.String, 'toString'),
     (java.Integer, 'intValue'),
-    (java.Short, 'shortValue'),
+    (java.Long, 'longValue'),
+    (java.Double, 'doubleValue'),
     (java.Float, 'floatValue'),
-    (java.Double, 'doubleValue')
+    (java.Boolean, 'booleanValue'),
+    (java.Short, 'shortValue'),
+    (java.Byte, 'byteValue'),
+    (java.Character, 'charValue'),
 )
 
+# java array class name => (JArray element type, array.array typecode, numpy dtype name)
+ARRAY_TYPE_MAPPING = {
+    '[Z' : ('bool', None, 'bool'),
+    '[B' : ('byte', 'b', 'int8'),
+    '[S' : ('short', 'h', 'int16'),
+    '[I' : ('int', 'i', 'int32'),
+    '[J' : ('long', LONG_TYPECODE, 'int64'),
+    '[F' : ('float', 'f', 'float32'),
+    '[D' : ('double', 'd', 'float64'),
+    '[C' : ('char', 'u', None),
+    '[Ljava.lang.String;' : ('string', None, None),
+}
+
 PY2J_TYPE_MAP = {
     int     : java.Integer,
     long    : java.Long,
     str     : java.String,
     unicode : java.String,
     float   : java.Double,
+    bool    : java.Boolean,
 }
 
+JAVA_INT_RANGE = (-2**31, 2**31 - 1)
+
+
+_op_state = threading.local()
+
+def set_op_counter(counter):
+    '''Sets the object whose count(n) is called for each write made through the
+    wrappers in the calling thread (or clears it, if None)'''
+    _op_state.counter = counter
+
+def count_ops(n=1):
+    '''Records n writes with the calling thread's op counter.  A batch transaction may
+    checkpoint here, so call it only once a write (eg. a new entity and its
+    properties) is complete'''
+    counter = getattr(_op_state, 'counter', None)
+    if counter is not None:
+        counter.count(n)
+
 
 #NOTE: should transaction handling take place at graph/node level or at model level.  Thinking model.
-###TODO
-def transactional(f, retry=False, retry_delay=5, retry_count=3):
-    def inner(frame, *args, **kwargs):
-        #ensure transaction
-        tx, created = frame._neo.get_tx()
+# java exceptions after which a transaction may succeed if retried
+TRANSIENT_EXCEPTIONS = frozenset((
+    'org.neo4j.kernel.DeadlockDetectedException',
+    'org.neo4j.kernel.impl.transaction.DeadlockDetectedException',
+    'org.neo4j.kernel.impl.transaction.LockException',
+))
+
+def is_transient_error(ex):
+    '''True if ex is a JavaError caused (at any depth) by a deadlock or lock failure'''
+    if not isinstance(ex, java.JavaError):
+        return False
+    jex = ex.getJavaException()
+    while jex is not None:
+        if jex.getClass().getName() in TRANSIENT_EXCEPTIONS:
+            return True
+        jex = jex.getCause()
+    return False
+
+
+class TransactionStats(object):
+    '''Counters for transactions run through transactional() and retrying()'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.attempts = 0           # transactions begun
+        self.retries = 0            # transactions retried after a transient error
+        self.failures = 0           # transactions given up on
+
+    def record(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        return dict(attempts=self.attempts, retries=self.retries, failures=self.failures)
+
+tx_stats = TransactionStats()
+
+
+class _Attempt(object):
+    def __init__(self, graph):
+        self._graph = graph
+        self.retry = False
+        self.error = None
+
+    def __enter__(self):
+        self._tx, self._created = self._graph.get_tx()
+        if self._created:
+            tx_stats.record('attempts')
+        return self._tx
+
+    def __exit__(self, type, value, traceback):
+        if not self._created:           # retrying is left to the outermost transaction
+            return False
+        if type is None:
+            try:
+                self._tx.finish(True)
+            except Exception, ex:       # eg. deadlock detected while committing
+                if not self._retryable(ex):
+                    raise
+            return False
         try:
-            retval = f(frame, *args, **kwargs)
-        except:
-            if created:
-                tx.failure()
-            raise
-        finally:
-            if created:
-                tx.finish(True)
-        return retval
-        
+            self._tx.failure()
+            self._tx.finish(False)
+        except Exception:
+            pass
+        return self._retryable(value)
+
+    def _retryable(self, ex):
+        if is_transient_error(ex):
+            self.error = ex
+            self.retry = True
+            return True
+        tx_stats.record('failures')
+        return False
+
+
+def retrying(graph, retry_count=3, retry_delay=0.05, max_delay=2.0):
+    '''Yields context managers, each running its block in a transaction of graph.
+    If the block or its commit fails with a deadlock or lock failure, the transaction
+    is rolled back and another attempt is yielded after a jittered exponential backoff
+    starting at retry_delay seconds, up to retry_count times.  Other errors propagate.
+
+        for attempt in retrying(gdb):
+            with attempt:
+                ...
+    '''
+    for n in xrange(retry_count + 1):
+        attempt = _Attempt(graph)
+        yield attempt
+        if not attempt.retry:
+            return
+        if n == retry_count:
+            tx_stats.record('failures')
+            raise attempt.error
+        tx_stats.record('retries')
+        time.sleep(min(max_delay, retry_delay * 2 ** n) * random.uniform(0.5, 1.5))
+
+
+def transactional(f=None, retry=False, retry_delay=0.05, retry_count=3):
+    '''Decorator for methods of objects with a _neo graph attribute, running them
+    in a transaction which is committed when they return and rolled back if they
+    raise.  With retry=True, deadlocks are retried as by retrying().  May be used
+    as @transactional or @transactional(retry=True, ...)'''
+    if f is None:
+        return lambda f: transactional(f, retry, retry_delay, retry_count)
+
+    @functools.wraps(f)
+    def inner(frame, *args, **kwargs):
+        for attempt in retrying(frame._neo, retry_count if retry else 0, retry_delay):
+            with attempt:
+                retval = f(frame, *args, **kwargs)
+            if not attempt.retry:
+                return retval
     return inner
 
 
@@ -74,17 +236,29 @@ def fancy_property(function):     # from http://wiki.python.org/moin/PythonDecor
     function()
     return property(**func_locals)
 
-class cached_property(property):
+class cached_property(object):
     '''Decorator. Caches result from property getter after
-    first reading.'''
+    first reading.  Classes with __slots__ must declare a
+    _cached_<name> slot for it, others keep it in their __dict__'''
     def __init__(self, f):
         self.__f = f
-        super(cached_property, self).__init__(self.fget)
+        self.__name = f.__name__
+        self.__slot = '_cached_' + f.__name__
+        self.__doc__ = f.__doc__
         
-    def fget(self, frame):
-        value = self.__f(frame)
-        frame.__dict__[self.__f.__name__] = property(self.__f)
-        return value
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        slot = getattr(owner, self.__slot, None)
+        if slot is None:
+            value = instance.__dict__[self.__name] = self.__f(instance)
+            return value
+        try:
+            return slot.__get__(instance, owner)        # bypasses any __getattr__ of instance
+        except AttributeError:
+            value = self.__f(instance)
+            slot.__set__(instance, value)
+            return value
 
 class _ClassCachedPropertyWrapper(object):
     def __init__(self, name, f):
@@ -114,6 +288,111 @@ def iterdescendents(cls, _seen=None):
                 yield sub
 
 
+class LRUCache(object):
+    '''Bounded mapping which drops the least recently used entry when full'''
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._map = {}                  # key => [prev, next, key, value]
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, key, default=None):
+        link = self._map.get(key)
+        if link is None:
+            return default
+        self._unlink(link)
+        self._append(link)
+        return link[3]
+
+    def __setitem__(self, key, value):
+        link = self._map.get(key)
+        if link is not None:
+            self._unlink(link)
+            link[3] = value
+        else:
+            if len(self._map) >= self.max_size:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._map[oldest[2]]
+            link = self._map[key] = [None, None, key, value]
+        self._append(link)
+
+    def pop(self, key, default=None):
+        link = self._map.pop(key, None)
+        if link is None:
+            return default
+        self._unlink(link)
+        return link[3]
+
+    def clear(self):
+        self._map.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        link[0], link[1] = last, root
+        last[1] = root[0] = link
+
+
+_rollback_listeners = weakref.WeakKeyDictionary()
+
+def on_rollback(listener):
+    '''Registers (weakly) an object whose invalidate() is called whenever a
+    transaction is rolled back, in any thread'''
+    _rollback_listeners[listener] = True
+
+def notify_rollback():
+    for listener in _rollback_listeners.keys():
+        listener.invalidate()
+
+
+_delete_listeners = weakref.WeakKeyDictionary()
+_tx_state = threading.local()
+
+def on_delete(listener):
+    '''Registers (weakly) an object whose invalidate() is called whenever a node or
+    relationship is deleted, and again when the deleting transaction commits'''
+    _delete_listeners[listener] = True
+
+def notify_delete():
+    _tx_state.deleted = True
+    for listener in _delete_listeners.keys():
+        listener.invalidate()
+
+def on_finish(listener):
+    '''Calls listener.tx_finished(committed) when the calling thread's transaction
+    finishes (or checkpoints)'''
+    listeners = getattr(_tx_state, 'listeners', None)
+    if listeners is None:
+        listeners = _tx_state.listeners = []
+    if not any(l is listener for l in listeners):
+        listeners.append(listener)
+
+def notify_finish(committed):
+    '''Called on the thread finishing a transaction, after the commit or rollback'''
+    listeners = getattr(_tx_state, 'listeners', None) or ()
+    deleted = getattr(_tx_state, 'deleted', False)
+    _tx_state.listeners = None
+    _tx_state.deleted = False
+    for listener in listeners:
+        listener.tx_finished(committed)
+    if committed and deleted:
+        for listener in _delete_listeners.keys():
+            listener.invalidate()
+
+
 class BufferedIterator(object):
     def __init__(self, java_node_iter, buffer_size=ITER_BUFFER_SIZE, constructor=None):
         self._iter = java_node_iter
@@ -158,13 +437,179 @@ def java_isinstance(jvalue, *types):
 #def java_isint(v):
 #    java_isinstance(v, java.Integer, java.Long, java.Short)
     
-    #TODO is there a better/faster way to do this?
-def java_to_py(v):
+def _value_converter(clazz, method):
+    cast = clazz.cast_
+    def convert(v):
+        return getattr(cast(v), method)()
+    return convert
+
+def _to_array(values, typecode, dtype):
+    if isinstance(values, str):     # byte arrays may come back as a raw string
+        values = array.array('b', values)
+    if USE_NUMPY and dtype is not None:
+        return numpy.array(values, dtype=dtype)
+    if typecode is not None:
+        return array.array(typecode, values)
+    return list(values)
+
+def _array_converter(jtype, typecode, dtype):
+    cast = java.JArray(jtype).cast_
+    def convert(v):
+        return _to_array(cast(v)[:], typecode, dtype)       # one bulk copy out of the JVM
+    return convert
+
+def jarray_to_py(jarray, class_name):
+    '''Converts a JArray returned by a java method as array properties are, class_name
+    being its java class name (eg. '[I' for int[])'''
+    jtype, typecode, dtype = ARRAY_TYPE_MAPPING[class_name]
+    return _to_array(jarray[:], typecode, dtype)
+
+# java class name => converter, filled in lazily for classes not listed here
+_JAVA_CONVERTERS = dict((clazz.class_.getName(), _value_converter(clazz, method))
+                        for clazz, method in VALUE_METHOD_MAPPING)
+_JAVA_CONVERTERS.update((name, _array_converter(*mapping))
+                        for name, mapping in ARRAY_TYPE_MAPPING.iteritems())
+
+def _find_converter(v, class_name):
     for clazz, method in VALUE_METHOD_MAPPING:
         if clazz.instance_(v):
-            return getattr(clazz.cast_(v), method)()
+            convert = _JAVA_CONVERTERS[class_name] = _value_converter(clazz, method)
+            return convert
     raise ValueError("Unknown value type:" + str(v))
 
+def java_to_py(v):
+    class_name = v.getClass().getName()
+    try:
+        convert = _JAVA_CONVERTERS[class_name]
+    except KeyError:
+        convert = _find_converter(v, class_name)
+    return convert(v)
+
+def snapshot_to_dict(jsnapshot):
+    values = [java_to_py(v) for v in jsnapshot.getValues()]
+    return dict(itertools.izip(jsnapshot.getKeys(), values))
+
+def entity_id(entity):
+    '''Accepts a Node/Relationship wrapper or an id'''
+    if isinstance(entity, (int, long)):
+        if isinstance(entity, bool):
+            raise TypeError("Entity [%s] is not an id" % (entity,))
+        return entity
+    return entity.id
+
+def ids_to_jarray(entities):
+    return java.JArray('long')([entity_id(e) for e in entities])
+
+def _java_type(cls):
+    '''Boxing java class for a python type, found along its MRO so subclasses of
+    the mapped types work.  None if unsupported'''
+    try:
+        return _PY2J_TYPE_CACHE[cls]
+    except KeyError:
+        pass
+    jtype = None
+    for base in cls.__mro__:
+        if base in PY2J_TYPE_MAP:
+            jtype = PY2J_TYPE_MAP[base]
+            break
+    _PY2J_TYPE_CACHE[cls] = jtype
+    return jtype
+
+_PY2J_TYPE_CACHE = {}
+
+def _jarray_types():
+    global _JARRAY_TYPES
+    if _JARRAY_TYPES is None:
+        _JARRAY_TYPES = tuple(java.JArray(jtype) for jtype, typecode, dtype in ARRAY_TYPE_MAPPING.itervalues())
+    return _JARRAY_TYPES
+
+_JARRAY_TYPES = None
+
+def py_to_java(v):
+    '''Box a python value as a java object, for use in Object[] arrays.  Java
+    objects are passed through unchanged'''
+    jtype = _java_type(type(v))
+    if jtype is None:
+        if isinstance(v, java.Object) or isinstance(v, _jarray_types()):
+            return v
+        raise TypeError("Value of unsupported type: %s" % (v,))
+    if jtype is java.Integer and not JAVA_INT_RANGE[0] <= v <= JAVA_INT_RANGE[1]:
+        jtype = java.Long
+    return jtype(v)
+
+def values_to_jarray(values):
+    return java.JArray('object')([py_to_java(v) for v in values])
+
+def _property_values(d, keys, values):
+    for k, v in d.iteritems():
+        try:
+            values.append(py_to_java(v))
+        except TypeError:
+            raise TypeError("Value of unsupported type for property '%s': %r" % (k, v))
+        keys.append(k)
+
+def properties_to_jarrays(d):
+    '''(keys, values) java arrays for a property dict, as taken by
+    EntityCreator.setProperties().  Raises TypeError naming the first key whose
+    value can't be stored, before anything is sent to the JVM'''
+    keys, values = [], []
+    _property_values(d, keys, values)
+    return java.JArray('string')(keys), java.JArray('object')(values)
+
+def flatten_properties(dicts):
+    '''(counts, keys, values) java arrays for a sequence of property dicts, as
+    taken by the org.neo4py helpers.  counts[i] entries belong to dicts[i]'''
+    counts, keys, values = [], [], []
+    for d in dicts:
+        d = d or {}
+        counts.append(len(d))
+        _property_values(d, keys, values)
+    return java.JArray('int')(counts), java.JArray('string')(keys), java.JArray('object')(values)
+
+def format_chunk(values, format, typecode, dtype):
+    '''values as a list, array.array(typecode) or numpy array of dtype, for format
+    'list', 'array' or 'numpy' (as taken by id_chunks()).  A typecode of None (no
+    array.array type is wide enough) gives a list for format 'array' too'''
+    if format == 'numpy':
+        if numpy is None:
+            raise ImportError("numpy is required for format 'numpy'")
+        return numpy.array(values, dtype=dtype)
+    if format == 'array' and typecode is not None:
+        return array.array(typecode, values)
+    return values
+
+def id_chunks(java_iter, chunk_size=BULK_CHUNK_SIZE, format=None, limit=None):
+    '''Ids of the nodes or relationships of a java iterator (up to limit of them, if
+    given), in chunks of up to chunk_size ids each read in a single call.  Chunks are
+    lists, 64 bit array.arrays (lists if the platform has no such typecode) or numpy
+    int64 arrays for format 'list', 'array' or 'numpy'.  By default numpy arrays are used if numpy is available, else arrays'''
+    if format is None:
+        format = 'numpy' if USE_NUMPY else 'array'
+    while limit is None or limit > 0:
+        size = chunk_size if limit is None else min(chunk_size, limit)
+        ids = java.Buffers.nextIds(java_iter, size)[:]
+        if not ids:
+            break
+        if limit is not None:
+            limit -= len(ids)
+        yield format_chunk(ids, format, LONG_TYPECODE, 'int64')
+        if len(ids) < size:
+            break
+
+def iter_ids(java_iter, chunk_size=BULK_CHUNK_SIZE):
+    '''Ids of the nodes or relationships of a java iterator as ints, read chunk_size at a time'''
+    for chunk in id_chunks(java_iter, chunk_size, 'list'):
+        for id in chunk:
+            yield id
+
+def iter_chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            break
+        yield chunk
+
 def dict_to_jmap(d):
     for k,v in d.iteritems():
         try:
@@ -177,9 +622,20 @@ def dict_to_jmap(d):
     jmap = java.HashMap().of_(key_type, value_type)
     for k,v in d.iteritems():
         jmap.put(k,v)
-        
+
     return jmap
 
+def props_to_jmap(d):
+    '''Map<String, Object> of property values, which may be of mixed types'''
+    jmap = java.HashMap().of_(java.String, java.Object)
+    if d:
+        for k,v in d.iteritems():
+            jmap.put(k, py_to_java(v))
+    return jmap
+
+def jmap_to_dict(jmap):
+    return dict((k.toString(), java_to_py(jmap.get(k))) for k in jmap.keySet())
+
 
 def UnimplementedError(Exception):
     pass
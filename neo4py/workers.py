@@ -0,0 +1,119 @@
+# Copyright (c) 2011 "Aaron Moffatt"
+# aaronmoffatt.com
+# 
+# This file is part of Neo4py.
+# 
+# Neo4py is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+# 
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import threading
+import Queue
+from backend import attach_thread, detach_thread
+
+__all__ = "WorkerPool", "Job"
+
+
+class Job(object):
+    '''Result of a function submitted to a WorkerPool'''
+    def __init__(self, f, args, kwargs):
+        self._f = f
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def _run(self):
+        try:
+            self._result = self._f(*self._args, **self._kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.isSet()
+
+    def result(self, timeout=None):
+        '''Waits for the job to finish and returns its result, re-raising any exception'''
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise RuntimeError("Job did not finish within %s seconds" % (timeout))
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class WorkerPool(object):
+    '''Fixed pool of threads attached to the JVM for running graph jobs in parallel.
+    If a graph is given, submit_tx() runs jobs in their own transactions'''
+    def __init__(self, max_workers, graph=None, name="neo4py-worker"):
+        self._graph = graph
+        self._jobs = Queue.Queue()
+        self._running = True
+        self._lock = threading.Lock()       # so no job is queued after the shutdown sentinels
+        self._threads = []
+        for i in xrange(max_workers):
+            t = threading.Thread(target=self._work, name="%s-%d" % (name, i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, f, *args, **kwargs):
+        job = Job(f, args, kwargs)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("WorkerPool has been shut down")
+            self._jobs.put(job)
+        return job
+
+    def submit_tx(self, f, *args, **kwargs):
+        '''As submit(), but f is run within a transaction which is committed if f
+        returns and rolled back if it raises'''
+        if self._graph is None:
+            raise ValueError("WorkerPool was not created with a graph")
+        return self.submit(self._graph._run_in_tx, f, *args, **kwargs)
+
+    def map(self, f, *iterables):
+        '''Results of f over the iterables, in order'''
+        jobs = [self.submit(f, *args) for args in zip(*iterables)]
+        return [job.result() for job in jobs]
+
+    def shutdown(self, wait=True):
+        '''Stops the workers once queued jobs are done, detaching them from the JVM'''
+        with self._lock:
+            if self._running:
+                self._running = False
+                for t in self._threads:
+                    self._jobs.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        self.shutdown(True)
+
+    def _work(self):
+        attach_thread(daemon=True)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                job._run()
+        finally:
+            detach_thread()
@@ -5,6 +5,7 @@ from os.path import join, dirname, exists
 import platform
 import runpy
 import shutil
+import subprocess
 
 import neo4py as __info__
 
@@ -31,15 +32,32 @@ NEO4J_JARS = {
 		"neo4j-community-1.3.jar",
 		"geronimo-jta_1.1_spec-1.1.1.jar",
 		"neo4j-lucene-index-1.3.jar",
+		"neo4j-graph-algo-1.3.jar",
 		"org.apache.servicemix.bundles.lucene-3.0.1_2.jar"
 	]
 }
 
 NEO4J_SUPPORTED_VERSIONS = ', '.join(NEO4J_JARS.keys())
 
+EXTS_JAR = join("java", "lib", "neo4j-neo4py-exts.jar")
+
 def read(fname):
 	return open(os.path.join(os.path.dirname(__file__), fname)).read()
 
+def build_extension_jar(neo4j_home, neo4j_ver):
+	'''Compiles the classes listed in java/classes.txt into the jar wrapped by jcc'''
+	classes_dir = os.path.abspath(join('build', 'java-classes'))
+	if not exists(classes_dir):
+		os.makedirs(classes_dir)
+	neo4j_lib = join(os.path.abspath(os.path.expanduser(neo4j_home)), 'lib')
+	classpath = os.pathsep.join(join(neo4j_lib, jar) for jar in NEO4J_JARS[neo4j_ver])
+	try:
+		subprocess.check_call(['javac', '-d', classes_dir, '-classpath', classpath, '@classes.txt'], cwd='java')
+		subprocess.check_call(['jar', 'cf', EXTS_JAR, '-C', classes_dir, 'org'])
+	except (OSError, subprocess.CalledProcessError), ex:
+		print "Error building the neo4py java extensions (javac and jar must be on the PATH): %s" %ex
+		sys.exit(1)
+
 def find_neo4j_version(neo4j_home):
 	readme = join(neo4j_home, 'README.txt')
 	if not exists(readme):
@@ -139,6 +157,8 @@ Supported Neo4j versions: %s""" %NEO4J_SUPPORTED_VERSIONS
 			print "Supported versions: %s" %NEO4J_SUPPORTED_VERSIONS
 			sys.exit(1)
 		
+		build_extension_jar(NEO4J_HOME, NEO4J_VER)
+		
 	else:
 		if not exists(build_info_file):
 			print """
@@ -160,7 +180,7 @@ Run 'setup.py build' first
 		"--debug",
 		"--shared",
 	
-		"--jar", join("java", "lib", "neo4j-neo4py-exts.jar"),
+		"--jar", EXTS_JAR,
 		"--package", "java.lang",
 		"--package", "java.util",
 		"--package", "javax.transaction",
@@ -168,12 +188,26 @@ Run 'setup.py build' first
 		"--package", "org.neo4j.graphdb",
 		"--package", "org.neo4j.graphdb.index",
 		"--package", "org.neo4j.index.impl.lucene",
+		"--package", "org.neo4j.kernel.impl.batchinsert",
+		"--package", "org.neo4j.graphdb.traversal",
+		"--package", "org.neo4j.helpers",
+		"--package", "org.neo4j.graphalgo",
 	
 		"org.neo4j.kernel.EmbeddedGraphDatabase",
 		"org.neo4j.graphdb.DynamicRelationshipType",
 		"org.neo4j.graphdb.index.IndexManager",
 		"org.neo4j.index.impl.lucene.LuceneIndexProvider",
+		"org.neo4j.kernel.impl.batchinsert.BatchInserterImpl",
+		"org.neo4j.index.impl.lucene.LuceneBatchInserterIndexProvider",
+		"org.neo4j.kernel.Traversal",
+		"org.neo4j.kernel.Uniqueness",
+		"org.neo4j.graphalgo.GraphAlgoFactory",
+		"org.neo4j.graphalgo.CommonEvaluators",
 		"java.util.HashMap",
+		"java.lang.Long",
+		"java.lang.Boolean",
+		"java.lang.Byte",
+		"java.lang.Character",
 	
 		"--exclude", "RelationshipIndex",
 	
@@ -0,0 +1,61 @@
+'''
+Memory used by the python side of node/relationship wrappers (not counting
+the JCC objects they hold, which are the same whatever the wrapper layout).
+
+    $ python test/bench_wrappers.py [count]
+'''
+import os
+import sys
+import shutil
+from neo4py import neo
+
+db_file = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bench-db.neo4j'))
+
+
+def wrapper_size(obj):
+    '''Bytes used by obj, its __dict__ if it has one, and the values cached in it
+    (not counting the JCC object, or None)'''
+    size = sys.getsizeof(obj)
+    if type(obj).__dictoffset__:
+        d = object.__getattribute__(obj, '__dict__')
+        size += sys.getsizeof(d)
+        size += sum(sys.getsizeof(v) for k, v in d.iteritems() if k != '__jobj__')
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            try:
+                value = cls.__dict__[slot].__get__(obj, cls)   # unset slots raise AttributeError
+            except AttributeError:
+                continue
+            if slot != '__jobj__' and value is not None:
+                size += sys.getsizeof(value)
+    return size
+
+def report(name, wrappers):
+    sizes = [wrapper_size(w) for w in wrappers]
+    print "%-28s %8.1f bytes/wrapper" % (name, float(sum(sizes)) / len(sizes))
+
+
+def main(count=10000):
+    shutil.rmtree(db_file, ignore_errors=True)
+    gdb = neo.init_graph(db_file)
+    try:
+        ids = gdb.create_nodes({} for i in xrange(count))
+        gdb.create_relationships((ids[i], "NEXT", ids[i + 1]) for i in xrange(count - 1))
+        
+        nodes = [gdb.nodes[id] for id in ids]
+        report("Node", nodes)
+        for n in nodes: n.id
+        report("Node (id read)", nodes)
+        
+        rels = list(nodes[0].relationships())
+        for n in nodes[1:]:
+            rels.extend(n.NEXT.outgoing)
+        report("Relationship", rels)
+        for r in rels: r.id, r.type, r.start, r.end
+        report("Relationship (id/type/ends)", rels)
+    finally:
+        gdb.shutdown()
+        shutil.rmtree(db_file, ignore_errors=True)
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
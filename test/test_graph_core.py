@@ -6,9 +6,16 @@ Created on May 27, 2011
 import os
 import unittest
 import shutil
+import threading
 from neo4py import neo
-from neo4py.traversal import Traverser
+from neo4py.backend import detach_thread
+from neo4py.util import transactional, tx_stats, format_chunk, LONG_TYPECODE
+from neo4py.traversal import Traverser, Predicate, MaxDepth, Depth, PropertyIn, LastRelationshipType, TraversalDescription, Uniqueness
 from neo4py.core import Direction
+from neo4py.bulk import BatchInserter
+from neo4py import algo, analytics
+from neo4py.index import SCORE
+from neo4py.util import numpy
 
 db_file = os.path.abspath(os.path.join(os.path.dirname(__file__), 'test-db.neo4j'))
 
@@ -84,7 +91,67 @@ class TestNodeCreation(unittest.TestCase):
         self.assertEqual(n1['number'], 5)
         
         if created: tx.finish(True)
-    
+
+    def test_node_snapshot(self):
+        tx, created = self.gdb.get_tx()
+        n1 = self.gdb.node(name="test", color="blue", number=5)
+        n2 = self.gdb.node(name="other")
+
+        self.assertEqual(n1.to_dict(), {'name': "test", 'color': "blue", 'number': 5})
+        self.assertEqual(dict(n1.iteritems()), n1.to_dict())
+
+        snapshots = self.gdb.nodes.snapshot([n1, n2.id])
+        self.assertEqual(snapshots, [n1.to_dict(), {'name': "other"}])
+
+        r = n1.KNOWS(n2, since=1999)
+        self.assertEqual(r.snapshot(), {'since': 1999})
+        self.assertEqual(self.gdb.rels.snapshot([r.id]), [{'since': 1999}])
+
+        if created: tx.finish(True)
+
+    def test_property_types(self):
+        tx, created = self.gdb.get_tx()
+        n = self.gdb.node(big=2**40, flag=True, ratio=0.5)
+        self.assertEqual(n['big'], 2**40)
+        self.assertEqual(n['flag'], True)
+        self.assertEqual(n['ratio'], 0.5)
+
+        n.update({'name': "wide"}, color="red", number=7)
+        self.assertEqual(n.to_dict(), {'big': 2**40, 'flag': True, 'ratio': 0.5,
+                                       'name': "wide", 'color': "red", 'number': 7})
+        try:
+            n.update(name="ok", bad=object())
+            self.fail("TypeError not raised")
+        except TypeError, ex:
+            self.assert_("'bad'" in str(ex))
+        self.assertEqual(n['name'], "wide")     # nothing written
+        n['big'] = 2**41
+        self.assertEqual(n['big'], 2**41)
+        self.assertRaises(TypeError, n.__setitem__, 'bad', object())
+        
+        class Name(unicode): pass
+        class Count(int): pass
+        boxed = n.__jobj__.getProperty('color')            # a java Object
+        n.update(name=Name(u"narrow"), number=Count(8), boxed=boxed)
+        self.assertEqual((n['name'], n['number'], n['boxed']), (u"narrow", 8, "red"))
+
+        if created: tx.finish(True)
+
+    def test_bulk_creation(self):
+        ids = self.gdb.create_nodes((dict(name=p.scientific_name) for p in rare_plants), chunk_size=3)
+        self.assertEqual(len(ids), len(rare_plants))
+        self.assertEqual(self.gdb.nodes[ids[0]]['name'], rare_plants[0].scientific_name)
+
+        root = self.gdb.create_nodes([{}])[0]
+        rel_ids = self.gdb.create_relationships(((id, "IS_A", root, {'n': i}) for i, id in enumerate(ids)),
+                                                chunk_size=3)
+        self.assertEqual(len(rel_ids), len(ids))
+        rel = self.gdb.rels[rel_ids[-1]]
+        self.assertEqual(rel.type, "IS_A")
+        self.assertEqual(rel.end.id, root)
+        self.assertEqual(rel['n'], len(ids) - 1)
+        self.assertRaises(TypeError, self.gdb.create_relationships, [(True, "IS_A", root)])
+
     def test_node_relations(self):
         tx, created = self.gdb.get_tx()
         
@@ -102,8 +169,212 @@ class TestNodeCreation(unittest.TestCase):
         self.assertEqual(len(relations), len(rare_plants))
         self.assertEqual(relation_lifeforms, set([p.lifeform for p in rare_plants]))
         
+        r = relations[0]
+        self.assert_(r.end is r.end)                # cached
+        self.assertEqual(r.end, plant_root)
+        self.assertEqual(r.type, 'IS_A')
+        self.assertRaises(AttributeError, setattr, r, 'color', "red")      # slotted, no __dict__
+
         if created: tx.finish(True)
 
+    def test_thread_transactions(self):
+        tx, created = self.gdb.get_tx()
+        self.assert_(created)
+        results = []
+
+        def worker():
+            worker_tx, worker_created = self.gdb.get_tx()       # attaches this thread to the JVM
+            results.append((worker_tx is tx, worker_created))
+            self.assertRaises(RuntimeError, tx.finish)
+            worker_tx.finish(True)
+            detach_thread()
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+
+        self.assertEqual(results, [(False, True)])
+        self.assert_(self.gdb.current_tx is tx)
+        tx.finish(True)
+        self.assert_(self.gdb.current_tx is None)
+        
+        self.gdb.node_indices                                   # cached by this thread
+        def index_names():
+            results.append(self.gdb.node_indices.names)         # still attaches this thread
+            detach_thread()
+        t = threading.Thread(target=index_names)
+        t.start()
+        t.join()
+        self.assertEqual(results[-1], self.gdb.node_indices.names)
+
+    def test_batch_tx(self):
+        with self.gdb.batch_tx(every=10) as tx:
+            for i in range(25):
+                self.gdb.node(number=i)            # 2 operations each
+            self.assert_(self.gdb.get_tx()[0] is tx)
+            self.assertEqual(tx._ops, 0)       # committed after every 10th operation
+            hub = self.gdb.node()
+            hub.SPOKE(self.gdb.node())
+            del hub.SPOKE.single
+            self.assertEqual(tx._ops, 4)       # deleting the relationship counts too
+
+        self.assert_(tx.finished)
+        self.assert_(self.gdb.current_tx is None)
+        self.assertRaises(ValueError, self.gdb.batch_tx)
+
+    def test_transactional(self):
+        class Planter(object):
+            def __init__(self, gdb):
+                self._neo = gdb
+            @transactional(retry=True)
+            def plant(self, name):
+                return self._neo.node(name=name).id
+            @transactional
+            def fail(self):
+                self._neo.node(name="never")
+                raise ValueError()
+
+        planter = Planter(self.gdb)
+        attempts = tx_stats.attempts
+        id = planter.plant("Iris")
+        self.assertEqual(tx_stats.attempts, attempts + 1)
+        self.assert_(self.gdb.current_tx is None)
+        self.assertEqual(self.gdb.nodes[id]['name'], "Iris")
+        self.assertRaises(ValueError, planter.fail)
+
+        for attempt in self.gdb.retrying():
+            with attempt:
+                id = self.gdb.node(name="Lupine").id
+        self.assertEqual(self.gdb.nodes[id]['name'], "Lupine")
+
+    def test_deadlock_retry(self):
+        first, second = self.gdb.create_nodes([{}, {}])
+        locked = [threading.Event(), threading.Event()]
+        attempts = []
+        
+        def writer(i, ids):
+            for attempt in self.gdb.retrying(retry_delay=0.01):
+                with attempt:
+                    attempts.append(i)
+                    self.gdb.nodes[ids[0]]['writer'] = i        # write locks ids[0]
+                    locked[i].set()
+                    locked[1 - i].wait(5)                       # until both hold a lock, first attempt only
+                    self.gdb.nodes[ids[1]]['writer'] = i        # one of the two deadlocks here
+            detach_thread()
+        
+        retries = tx_stats.retries
+        threads = [threading.Thread(target=writer, args=(0, (first, second))),
+                   threading.Thread(target=writer, args=(1, (second, first)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(len(attempts), 3)                      # the deadlocked writer ran twice
+        self.assertEqual(tx_stats.retries, retries + 1)
+        self.assertEqual(self.gdb.nodes[first]['writer'], self.gdb.nodes[second]['writer'])
+
+    def test_ids(self):
+        tx, created = self.gdb.get_tx()
+        hub = self.gdb.node()
+        spokes = [self.gdb.node() for i in range(5)]
+        rels = [hub.SPOKE(n) for n in spokes] + [hub.RIM(spokes[0])]
+        
+        node_ids = list(self.gdb.nodes.ids(chunk_size=2))
+        self.assertEqual(node_ids, [n.id for n in self.gdb.nodes])
+        self.assert_(hub.id in node_ids)
+        self.assertEqual(sum(len(c) for c in self.gdb.nodes.id_chunks(chunk_size=3, format='array')), len(node_ids))
+        self.assertEqual(list(format_chunk([2**40], 'array', LONG_TYPECODE, 'int64')), [2**40])   # ids above 2^31
+        if numpy is None:
+            self.assertRaises(ImportError, format_chunk, [1], 'numpy', LONG_TYPECODE, 'int64')
+        
+        self.assertEqual(sorted(hub.relationships().ids()), sorted(r.id for r in rels))
+        self.assertEqual(sorted(hub.SPOKE.outgoing.ids(chunk_size=2)), sorted(r.id for r in rels[:-1]))
+        self.assertEqual(list(hub.relationships('SPOKE', 'RIM').ids()), [r.id for r in hub.relationships('SPOKE', 'RIM')])
+        self.assertEqual(list(spokes[1].SPOKE.outgoing.ids()), [])
+        self.assertEqual(sorted(r.id for r in hub.relationships('SPOKE', 'RIM').outgoing), sorted(r.id for r in rels))
+        self.assertEqual([r.id for r in spokes[0].relationships('SPOKE', 'RIM').incoming], [rels[0].id, rels[-1].id])
+        self.assert_(spokes[0].relationships('SPOKE', 'RIM').incoming)
+        self.assert_(not spokes[1].relationships('SPOKE', 'RIM').outgoing)
+        
+        self.assertEqual(hub.degree(), 6)
+        self.assertEqual(hub.degree('SPOKE'), 5)
+        self.assertEqual(hub.degree('SPOKE', 'RIM', direction=Direction.Incoming), 0)
+        self.assertEqual(spokes[0].degree(direction=Direction.Incoming), 2)
+        self.assertEqual(hub.SPOKE.outgoing.count(), 5)
+        self.assertEqual(spokes[0].relationships().count(), 2)
+        self.assertEqual(list(self.gdb.degrees([hub, spokes[0].id, spokes[1]], ['SPOKE'])), [5, 1, 1])
+        
+        for i, n in enumerate(spokes):
+            n['position'] = i
+        spokes[2]['name'] = "two"
+        neighbors = list(hub.neighbors('SPOKE', direction=Direction.Outgoing, props=['position', 'name']))
+        self.assertEqual(sorted(neighbors), sorted([(n.id, {'position': i}) for i, n in enumerate(spokes) if i != 2] +
+                                                   [(spokes[2].id, {'position': 2, 'name': "two"})]))
+        self.assertEqual(len(list(hub.neighbors(limit=3, buffer_size=2))), 3)
+        self.assertEqual(list(spokes[0].neighbors('RIM')), [(hub.id, {})])
+        self.assertEqual(list(spokes[0].neighbors('RIM', direction=Direction.Outgoing)), [])
+        
+        far = self.gdb.node()
+        spokes[1].FAR(far)
+        if created:
+            tx.finish(True)                 # parallel khop threads only see committed data
+            tx, created = self.gdb.get_tx()
+        
+        for parallel in (False, True):
+            hops = self.gdb.khop([hub, spokes[1].id, far], depth=2, types=['SPOKE', 'FAR'], parallel=parallel)
+            self.assertEqual(len(hops), 3)
+            self.assertEqual(sorted(hops[0]), sorted([n.id for n in spokes] + [far.id]))
+            self.assertEqual(sorted(list(hops[1])[:2]), sorted([hub.id, far.id]))      # nearest first
+            self.assertEqual(sorted(hops[2]), sorted([spokes[1].id, hub.id]))
+        one_hop = self.gdb.khop([hub], depth=1, types=['SPOKE'], direction=Direction.Outgoing, max_nodes_per_seed=2)
+        self.assertEqual(len(one_hop[0]), 2)
+        
+        if created: tx.finish(True)
+
+    def test_identity_map(self):
+        tx, created = self.gdb.get_tx()
+        id = self.gdb.node(name="hub").id
+        plain = self.gdb.nodes[id]
+        self.assert_(plain is not self.gdb.nodes[id])
+
+        with self.gdb.session(max_size=2) as session:
+            hub = self.gdb.nodes[id]
+            self.assert_(hub is self.gdb.nodes[id])
+            self.assertEqual(hub['name'], "hub")
+            hub['name'] = "moved"
+            self.assertEqual(self.gdb.nodes[id]['name'], "moved")
+
+            for i in range(3):
+                self.gdb.node()
+            self.assert_(hub is not self.gdb.nodes[id])       # evicted
+            self.assertEqual(len(session), 2)
+
+            def rollback():
+                other, created = self.gdb.get_tx()
+                other.failure()
+                other.finish()
+                detach_thread()
+            thread = threading.Thread(target=rollback)
+            thread.start()
+            thread.join()
+            self.assertEqual(len(session), 2)                 # another thread's rollback leaves it
+
+            tx.failure()
+            tx.finish()
+            self.assertEqual(len(session), 0)                 # rollback clears the cache
+
+    def test_executor(self):
+        def create(i):
+            return self.gdb.node(number=i).id
+
+        with self.gdb.executor(4) as pool:
+            ids = [job.result() for job in [pool.submit_tx(create, i) for i in range(20)]]
+            numbers = pool.map(lambda id: self.gdb.nodes[id]['number'], ids)
+
+        self.assertEqual(numbers, range(20))
+        self.assertRaises(RuntimeError, pool.submit, create, 0)      # shut down by the with block
+
 class TestIndices(unittest.TestCase):
     def setUp(self):
         self.gdb = gdb = neo.init_graph(db_file)
@@ -175,6 +446,7 @@ class TestIndices(unittest.TestCase):
 #        rel_hits.close()
         
         print "Perennial herbs:", [r.start['sciname'] for r in rels]
+        self.assertEqual(sorted(self.rel_idx['lifeform', "Perennial herb"].ids()), sorted(r.id for r in rels))
 
         
     def test_fulltext_indexing(self):
@@ -189,6 +461,122 @@ class TestIndices(unittest.TestCase):
         self.assertEqual(verbena['sciname'], "Abronia maritima")
         print "Verbena: " + verbena['sciname']
         self.assertEqual(verbena.IS_A.single['lifeform'], 'Perennial herb')
+    
+    def test_hit_pages(self):
+        names = [n['sciname'] for n in self.fulltext_idx.query('lifeform:herb')]
+        self.assertEqual(len(names), 7)
+        
+        with self.fulltext_idx.query('lifeform:herb') as hits:
+            page = hits[2:5]
+            self.assertEqual(len(page), 3)
+            self.assertEqual([n['sciname'] for n in page], names[2:5])
+        
+        self.assertEqual([n['sciname'] for n in self.fulltext_idx.query('lifeform:herb')[5:]], names[5:])
+        self.assertEqual([n['sciname'] for n in self.fulltext_idx.query('lifeform:herb')[1:10][1:3]], names[2:4])
+        self.assertEqual(self.fulltext_idx.query('lifeform:herb')[3]['sciname'], names[3])
+        self.assertEqual(len(self.fulltext_idx.query('lifeform:herb')[6:20]), 1)
+        
+        hits = self.fulltext_idx.query('lifeform:herb')
+        ids = list(hits[4:6].ids())
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(len(hits), 7)          # still known once closed
+        
+        with self.fulltext_idx.query('lifeform:herb') as hits:
+            pages = [[n['sciname'] for n in hits[i:i + 3]] for i in (0, 3, 6)]
+            self.assertEqual(pages, [names[0:3], names[3:6], names[6:]])
+        with self.fulltext_idx.query('lifeform:herb') as hits:
+            self.assertEqual([n['sciname'] for n in hits[1:2]], names[1:2])
+            self.assertEqual([n['sciname'] for n in hits[4:6]], names[4:6])      # skips the gap
+            self.assertRaises(ValueError, list, hits[5:7])                      # overlaps
+    
+    def test_sorted_query(self):
+        names = sorted(p.scientific_name for p in rare_plants if p.scientific_name.startswith('A'))
+        hits = self.node_idx.query('sciname:A*', sort='sciname')
+        self.assertEqual([n['sciname'] for n in hits], names)
+        hits = self.node_idx.query('sciname:A*', sort='-sciname', top=2, trade_correctness_for_speed=True)
+        self.assertEqual([n['sciname'] for n in hits], names[::-1][:2])
+        self.assertRaises(TypeError, self.node_idx.query, 42, sort='sciname')
+        
+        query = 'name:verbena OR lifeform:herb'
+        scored = list(self.fulltext_idx.query(query, sort=SCORE).withscore())
+        self.assertEqual(len(scored), 7)
+        self.assertEqual(scored[0][0]['sciname'], "Abronia maritima")
+        scores = [score for n, score in scored]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        
+        top = list(self.fulltext_idx.query(query, sort=SCORE, top=3).scored_ids())
+        self.assertEqual(top, [(n.id, score) for n, score in scored[:3]])
+        ids, chunk_scores = iter(self.fulltext_idx.query(query, sort=SCORE).score_chunks(format='list')).next()
+        self.assertEqual(ids, [n.id for n, score in scored])
+        self.assertEqual(chunk_scores, scores)
+    
+    def test_bulk_indexing(self):
+        idx = self.gdb.node_indices.create("plant genus index")
+        plants = list(self.node_idx.query('sciname:A*'))
+        idx.add_many([(n, 'genus', n['sciname'].split()[0]) for n in plants] +
+                     [(n.id, 'kind', 'plant') for n in plants], chunk_size=3)
+        self.assertEqual(sorted(idx['kind', 'plant'].ids()), sorted(n.id for n in plants))
+        self.assertEqual(len(idx['genus', 'Abronia']), 2)
+        
+        idx.remove_many([(n.id, 'kind', 'plant') for n in plants[:2]])
+        self.assertEqual(sorted(idx['kind', 'plant'].ids()), sorted(n.id for n in plants[2:]))
+        
+        fern = self.rel_idx['lifeform', 'Fern'].single
+        self.assertRaises(TypeError, idx.add_many, [(fern, 'kind', 'plant')])
+        self.assertRaises(TypeError, idx.add_many, [(True, 'kind', 'plant')])
+    
+    def test_get_many(self):
+        names = [p.scientific_name for p in rare_plants[:4]] + ["Rosa nonexistentia"]
+        found = self.node_idx.get_many('sciname', names + names[:2])
+        self.assertEqual(sorted(found), sorted(names))
+        for name in names[:4]:
+            self.assertEqual(found[name], [self.node_idx['sciname', name].single.id])
+        self.assertEqual(found["Rosa nonexistentia"], [])
+        
+        lifeforms = self.rel_idx.get_many('lifeform', ["Perennial herb", "Fern"])
+        self.assertEqual(len(lifeforms["Perennial herb"]), 5)
+        self.assertEqual(lifeforms["Fern"], [self.rel_idx['lifeform', 'Fern'].single.id])
+    
+    def test_cached_lookups(self):
+        idx = self.node_idx.enable_cache(100)
+        iris = idx['sciname', "Iris bracteata"].single
+        self.assertEqual(idx['sciname', "Iris bracteata"].single, iris)
+        self.assertEqual((idx.cache_hits, idx.cache_misses), (1, 1))
+        self.assertEqual(idx.get_many('sciname', ["Iris bracteata"]), {"Iris bracteata": [iris.id]})
+        self.assertEqual(idx.cache_hits, 2)
+        
+        nova = self.gdb.node(sciname="Iris nova")
+        self.assertEqual(len(idx['sciname', "Iris nova"]), 0)
+        idx['sciname', "Iris nova"] = nova
+        self.assertEqual(idx['sciname', "Iris nova"].single, nova)
+        del idx[nova, 'sciname', "Iris nova"]
+        self.assertEqual(len(idx['sciname', "Iris nova"]), 0)
+        
+        self.tx.finish(True)
+        self.tx, created = self.gdb.get_tx()
+        idx['sciname', "Iris nova"] = nova
+        self.assertEqual(len(idx['sciname', "Iris nova"]), 1)
+        self.tx.finish(False)                   # rolled back
+        self.tx, created = self.gdb.get_tx()
+        self.assertEqual(len(idx['sciname', "Iris nova"]), 0)
+        
+        idx['sciname', "Iris nova"] = nova
+        with self.gdb.executor(1) as pool:
+            lookup = lambda: len(idx['sciname', "Iris nova"])
+            self.assertEqual(pool.submit(lookup).result(), 0)      # uncommitted here
+            self.assertEqual(lookup(), 1)
+            self.tx.finish(True)
+            self.tx, created = self.gdb.get_tx()
+            self.assertEqual(pool.submit(lookup).result(), 1)      # stale entry dropped on commit
+        
+        misses = idx.cache_misses
+        self.assertEqual(len(idx['sciname', "Iris nova"]), 1)
+        self.assertEqual(idx.cache_misses, misses)
+        nova.delete()
+        self.tx.finish(True)
+        self.tx, created = self.gdb.get_tx()
+        idx['sciname', "Iris nova"]
+        self.assertEqual(idx.cache_misses, misses + 1)                  # cleared by the delete
         
 
 class TestTraversal(unittest.TestCase):
@@ -241,7 +629,123 @@ class TestTraversal(unittest.TestCase):
                 print " ==> rel: ", r.type
         
         self.assertEqual(len(plant_nodes), len(rare_plants))
-    
+        self.assertEqual(list(PlantFinder(self.plant_root).ids()), [n.id for n in plant_nodes])
+
+    def test_predicate_traversal(self):
+        plant_names = [p.common_names[0] for p in rare_plants]
+        herb_names = [p.common_names[0] for p in rare_plants if p.lifeform.endswith("herb")]
+        
+        class LifeformFinder(Traverser):
+            types = [Direction.Incoming.IS_A, Direction.Outgoing.CHILD]
+            is_stop = MaxDepth(2)
+            is_returnable = Depth(min=2) & LastRelationshipType('IS_A') & ~PropertyIn('name', plant_names)
+        
+        names = sorted(n['name'] for n in LifeformFinder(self.gdb.reference_node))
+        self.assertEqual(names, sorted(n['name'] for n in self.lifeform_nodes.values()))
+        
+        class PlantFinder(Traverser):
+            types = [Direction.Incoming.IS_A]
+            is_stop = MaxDepth(2)
+            is_returnable = PropertyIn('name', herb_names)
+        
+        names = sorted(n['name'] for n in PlantFinder(self.lifeform_root))
+        self.assertEqual(names, sorted(herb_names))
+        
+        self.assertRaises(NotImplementedError, Predicate().compile)
+        self.assertRaises(TypeError, TraversalDescription().filter, MaxDepth(1))
+        self.assertRaises(TypeError, TraversalDescription().filter, MaxDepth(1) & Depth(min=1))
+
+    def test_traversal_description(self):
+        plants = TraversalDescription().breadth_first().expand(Direction.Incoming.IS_A) \
+                    .uniqueness(Uniqueness.NODE_GLOBAL).prune(MaxDepth(1)).filter(Depth(min=1))
+        
+        paths = list(plants.traverse(self.plant_root))
+        self.assertEqual(len(paths), len(rare_plants))
+        for path in paths:
+            self.assertEqual(len(path), 1)
+            self.assertEqual(path.start_id, self.plant_root.id)
+            self.assertEqual(path.relationships[0].type, 'IS_A')
+            self.assertEqual(path.end, path.relationships[0].start)
+        
+        names = sorted(n['name'] for n in plants.traverse(self.plant_root).nodes())
+        self.assertEqual(names, sorted(p.common_names[0] for p in rare_plants))
+        
+        # plants reach their lifeform, which reaches every plant of that lifeform
+        everything = TraversalDescription().expand('IS_A').uniqueness(Uniqueness.NODE_GLOBAL)
+        reached = set(path.end_id for path in everything.traverse(self.lifeform_root))
+        self.assert_(self.plant_root.id in reached)
+
+    def test_path_finding(self):
+        plant_ids = [r.start.id for r in self.plant_root.IS_A.incoming]
+        start, end = self.gdb.nodes[plant_ids[0]], self.gdb.nodes[plant_ids[-1]]
+        
+        path = algo.shortest_path(start, end, [Direction.Both.IS_A])
+        self.assertEqual(len(path), 2)
+        self.assertEqual((path.start_id, path.end_id), (start.id, end.id))
+        self.assertEqual(algo.shortest_path(start, end, ['IS_A'], max_depth=1), None)
+        self.assert_(len(list(algo.all_shortest_paths(start, end, ['IS_A']))) >= 1)
+        for path in algo.all_simple_paths(start, end, ['IS_A'], max_depth=4):
+            self.assertEqual(len(set(path.node_ids)), len(path.node_ids))
+        
+        a, b, c = self.gdb.node(), self.gdb.node(), self.gdb.node()
+        a.ROAD(b, km=1.0)
+        b.ROAD(c, km=1.5)
+        a.ROAD(c, km=10.0)
+        path = algo.dijkstra(a, c, 'km', [Direction.Outgoing.ROAD])
+        self.assertEqual(path.node_ids, [a.id, b.id, c.id])
+        self.assertEqual(path.weight, 2.5)
+
+    def test_analytics(self):
+        if numpy is None:
+            self.skipTest("numpy is not installed")
+        csr = self.gdb.to_csr(['IS_A'])
+        plant_row = csr.row(self.plant_root.id)
+        self.assertEqual(len(csr.neighbors(plant_row)), 0)
+        plant_rows = csr.rows([r.start.id for r in self.plant_root.IS_A.incoming])
+        self.assert_((analytics.degrees(csr)[plant_rows] == 2).all())      # plant root and lifeform
+        
+        incoming = self.gdb.to_csr(['IS_A'], Direction.Incoming)
+        self.assertEqual(sorted(incoming.neighbors(plant_row)), sorted(plant_rows))
+        self.assert_(analytics.degree_histogram(incoming)[len(rare_plants)] >= 1)
+        
+        rank = analytics.pagerank(csr)
+        self.assertAlmostEqual(rank.sum(), 1.0)
+        self.assert_(rank[plant_row] > rank[plant_rows].max())
+        
+        zero_weight = analytics.CSRGraph(numpy.array([1, 2, 3]), numpy.array([0, 1, 2, 3]),
+                                         numpy.array([1, 2, 0]), numpy.array([0.0, 1.0, 2.0]))
+        rank = analytics.pagerank(zero_weight, weighted=True)
+        self.assertFalse(numpy.isnan(rank).any())
+        self.assertAlmostEqual(rank.sum(), 1.0)
+        
+        labels = analytics.weakly_connected_components(csr)
+        self.assertEqual(labels[plant_row], labels[csr.row(self.lifeform_root.id)])
+        self.assertNotEqual(labels[plant_row], labels[csr.row(self.gdb.reference_node.id)])
+
+
+class TestBatchInsert(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = db_file + "-batch"
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_batch_insert(self):
+        inserter = BatchInserter(self.db_dir)
+        idx = inserter.node_indices.create("plant node index")
+        id_map = inserter.load_nodes((dict(sciname=p.scientific_name, lifeform=p.lifeform) for p in rare_plants),
+                                     id_key='sciname', index=idx, index_keys=['sciname'])
+        root = inserter.node(name="plant")
+        inserter.load_relationships(dict(start=id_map[p.scientific_name], type="IS_A", end=root)
+                                    for p in rare_plants)
+        idx.flush()
+        self.assertEqual(idx['sciname', "Iris bracteata"], [id_map["Iris bracteata"]])
+        self.assertEqual(inserter.node_properties(root), {'name': "plant"})
+        inserter.shutdown()
+
+        gdb = neo.GraphDatabase(self.db_dir)
+        iris = gdb.node_indices["plant node index"]['sciname', "Iris bracteata"].single
+        self.assertEqual(iris.IS_A.single.end.id, root)
+        gdb.shutdown()
+
 if __name__ == '__main__':
     unittest.main()
     